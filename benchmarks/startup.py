@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Measures how long the command line tools take to start.
+
+Each command is run several times in a fresh interpreter and the median wall
+time is compared with its budget. The cumulative import time of each module
+(from `python -X importtime`) is reported as well, so a new module level import
+shows up here before it shows up in build times.
+
+    $ python benchmarks/startup.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RUNS = 7
+
+# Budgets in milliseconds. Interpreter startup alone is included in the wall times.
+IMPORT_BUDGETS = {
+    'ies2xml': 60,
+    'xml2ies': 60,
+    'ies': 40,
+}
+COMMAND_BUDGETS = {
+    ('ies.py', '-h'): 150,
+    ('ies.py', 'to-xml', '-h'): 150,
+    ('ies.py', 'to-ies', '-h'): 150,
+    ('ies2xml.py', '-h'): 150,
+    ('xml2ies.py', '-h'): 150,
+}
+
+
+def import_time_ms(module: str):
+    """Gets the cumulative import time of a module.
+
+    Args:
+        module (str): the module to import
+
+    Returns:
+        float: the median cumulative import time in milliseconds
+
+    """
+    samples = []
+    for _ in range(RUNS):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd = ROOT, capture_output = True, text = True, check = True
+            )
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = [part.strip() for part in line.split('|')]
+            if len(parts) == 3 and parts[2] == module:
+                samples.append(int(parts[1]) / 1000)
+    return statistics.median(samples)
+
+
+def command_time_ms(command: tuple):
+    """Gets the wall time of running a command in a fresh interpreter.
+
+    Args:
+        command (tuple): the script and its arguments
+
+    Returns:
+        float: the median wall time in milliseconds
+
+    """
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *command], cwd = ROOT,
+            stdout = subprocess.DEVNULL, check = True
+            )
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    """Runs all measurements and exits with 1 if any budget is exceeded."""
+    over_budget = False
+    print(f'{"measurement":<32}{"median ms":>12}{"budget ms":>12}')
+    for module, budget in IMPORT_BUDGETS.items():
+        elapsed = import_time_ms(module)
+        over_budget |= elapsed > budget
+        print(f'{"import " + module:<32}{elapsed:>12.1f}{budget:>12}')
+    for command, budget in COMMAND_BUDGETS.items():
+        elapsed = command_time_ms(command)
+        over_budget |= elapsed > budget
+        print(f'{" ".join(command):<32}{elapsed:>12.1f}{budget:>12}')
+    if over_budget:
+        print('Startup budget exceeded')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('PYTHONDONTWRITEBYTECODE', '1')
+    main()
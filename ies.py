@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+import argparse
+import importlib
+import sys
+
+# Each command is handed to the `main` of its module along with any leading arguments.
+# Modules are only imported once a command is chosen, so `--help` stays fast.
+COMMANDS = {
+    'to-xml': ('ies2xml', [], 'Convert .ies files to .xml (file, batch or inspect)'),
+    'to-ies': ('xml2ies', [], 'Convert .xml files to .ies (file or batch)'),
+    'inspect': ('ies2xml', ['inspect'], 'Catalog and validate .ies files without decoding rows'),
+    'patch': ('iespatch', [], 'Edit cells of an existing .ies file in place'),
+    'transform': ('iestransform', [], 'Transform the rows of .ies files with python functions without xml'),
+    'serve': ('iesserver', ['serve'], 'Run a local conversion server with warm worker processes'),
+    'client': ('iesserver', ['client'], 'Send conversions to a running conversion server'),
+    'stats': ('iesstats', [], 'Write column statistics of .ies files and scan them, skipping what cannot match'),
+}
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the command line parser for the single `ies` entry point
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        prog = 'ies',
+        description = 'Tree of Savior .ies and .xml converter',
+        epilog = 'Run "ies <command> -h" for the options of a command'
+    )
+    subparser = parser.add_subparsers(
+        help = 'command help',
+        required = True,
+        dest = 'command'
+    )
+    for command, (_, _, help_text) in COMMANDS.items():
+        subparser.add_parser(command, help = help_text)
+
+    return parser
+
+def main(argv: list[str] | None = None):
+    """Runs the command chosen on the command line
+
+    Args:
+        argv (list[str] | None, optional): The arguments without the program name. Defaults to sys.argv[1:].
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 0 or argv[0] not in COMMANDS:
+        # Only prints the help or the usage error
+        build_parser().parse_args(argv)
+        return
+    
+    module_name, leading_arguments, _ = COMMANDS[argv[0]]
+    module = importlib.import_module(module_name)
+    # Leading arguments already name the command, e.g. "ies inspect" is "ies2xml.py inspect"
+    prog = 'ies' if leading_arguments else f'ies {argv[0]}'
+    module.main(leading_arguments + argv[1:], prog)
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,33 @@
 #!/usr/bin/env python
 import argparse
+import json
 import os
 import struct
 import re
+from functools import lru_cache
 from pathlib import Path
-from xml.etree.ElementTree import Element, SubElement, ElementTree, tostring
-from xml.dom.minidom import parseString
-from tqdm import tqdm
-
-parser = argparse.ArgumentParser(
-    description = 'An .ies file to xml converter'
-    )
-subparser = parser.add_subparsers(
-    help = 'subcommand help',
-    required = True,
-    dest = 'subcommand'
-    )
-
-parser_file = subparser.add_parser(
-    'file',
-    help = 'file help'
-    )
-parser_file.add_argument(
-    '--output', '-o',
-    required = False,
-    help = 'An optional file to output to; overrides default file name',
-    type = Path
-    )
-parser_file.add_argument(
-    'ies_file',
-    help = 'The .ies file to convert',
-    type = Path
-    )
-
-parser_batch = subparser.add_parser(
-    'batch',
-    help = 'batch help'
-    )
-parser_batch.add_argument(
-    'directory',
-    help = 'The directory with .ies files to batch convert',
-    type = Path
-    )
+from ies_tools.binarywriter import STRING_CACHE_SIZE, format_cache_info
+from ies_tools.columntype import ColumnType
+from ies_tools.discovery import find_files, mirror_path
+from ies_tools.iescolumn import IesColumn
+from ies_tools.parallel import PARALLEL_MIN_ROWS, get_pool
+from ies_tools.propertyaccess import PropertyAccess
+from ies_tools.schemacache import SchemaCache
+from ies_tools.xmlbackend import get_backend
 
 NULL_BYTE = '\x00'
 SEPARATOR = '\t'
 LINE = '\n'
+# Everything up to and including `ncols_str` at offset 152.
+HEADER_SIZE = 154
+# 64 + 64 for the names, 2 for the type, 4 for `dummy` and 2 for the index.
+COLUMN_SIZE = 136
 
+@lru_cache(maxsize = STRING_CACHE_SIZE)
 def convert_bytestring(bstr: bytes):
     """Converts a bytestring to a readable string.
+    Results are cached for the whole run, since the same strings repeat
+    across rows and files; see `convert_bytestring.cache_info()`.
 
     Args:
         bstr (bytes): the bytestring to decode
@@ -92,7 +71,8 @@ def clean_column_names(name: str) -> str:
     
     
 def get_col_names(
-    file: Path, bstr: bytes, ncols: int, offset: int, ncols_int: int
+    file: Path, bstr: bytes, ncols: int, offset: int, ncols_int: int,
+    full_names: bool = False
     ):
     """Gets column names from the bytestring of an `.ies` file.
 
@@ -102,6 +82,9 @@ def get_col_names(
         ncols (int): number of columns
         offset (int): offset to start from the bytestring
         ncols_int (int): offset to specific columns
+        full_names (bool, optional): return the full property names
+            (e.g. `CP_Calc`) instead of the short column names (`CP_`)
+            used in the xml. Defaults to False.
 
     Returns:
         dict: with key = index and value = column name
@@ -113,7 +96,8 @@ def get_col_names(
     col_names = {}
     for _ in range(ncols):
         #bstr_str = bstr[offset:offset+64]
-        col_name = convert_bytestring(bstr[offset:offset+64])
+        name_offset = offset + 64 if full_names else offset
+        col_name = convert_bytestring(bstr[name_offset:name_offset+64])
        
         # col_name = clean_column_names(col_name)
         #print(f'The byte string = {bstr_str}\nThe total Size = {len(bstr_str)}\nCol name = {col_name}')
@@ -149,6 +133,42 @@ def get_col_names(
     return col_names
 
 
+def get_col_schema(bstr: bytes, ncols: int, offset: int):
+    """Gets the full column information from the bytestring of an `.ies`
+    file, in the order the columns are stored.
+
+    Args:
+        bstr (bytes): the bytestring
+        ncols (int): number of columns
+        offset (int): offset to start from the bytestring
+
+    Returns:
+        list: `IesColumn` for each column, named the way the column
+            appears in the xml written by `convert_file`
+
+    Raises:
+        ValueError: if a column type or property access is unknown
+
+    """
+    columns = []
+    for _ in range(ncols):
+        column = IesColumn()
+        column.column = convert_bytestring(bstr[offset:offset+64])
+        column.name = column.column
+        offset += 128
+        col_type, access, sync, col_idx = struct.unpack(
+            '<4H', bstr[offset:offset+8]
+            )
+        offset += 8
+        column.column_type = ColumnType(col_type)
+        column.property_access = PropertyAccess(access)
+        column.sync = sync
+        column.declaration_index = col_idx
+        columns.append(column)
+
+    return columns
+
+
 def get_rows(
     file: Path, bstr: bytes, tsv: list, nrows: int, offset: int,
     ncols_int: int, ncols_str: int
@@ -216,16 +236,218 @@ def get_rows(
 
     return tsv
 
-def pretty_print_xml(tsv:list, header:str, path:Path):
-    """Converts the given tsv to an xml file
+def scan_row_offsets(
+    bstr: bytes, nrows: int, offset: int, ncols_int: int, ncols_str: int
+    ):
+    """Finds where each row starts without decoding any values.
+    Only the `row_class` and string lengths are read to skip ahead.
+
+    Args:
+        bstr (bytes): the bytestring
+        nrows (int): number of rows
+        offset (int): offset of the first row
+        ncols_int (int): number of numeric columns
+        ncols_str (int): number of string columns
+
+    Returns:
+        list: `nrows + 1` offsets; the last one is the end of the rows
+
+    """
+    offsets = []
+    for _ in range(nrows):
+        offsets.append(offset)
+        # 4 bytes for the id, then the length prefixed `row_class`
+        offset += 4
+        offset += 2 + struct.unpack_from('<H', bstr, offset)[0]
+        offset += 4 * ncols_int
+        for _ in range(ncols_str):
+            offset += 2 + struct.unpack_from('<H', bstr, offset)[0]
+        # one `user_scr` flag per string column
+        offset += ncols_str
+    offsets.append(offset)
+    return offsets
+
+
+def decode_row_chunk(
+    file: Path, shm_name: str, start: int, end: int, nrows: int,
+    ncols_int: int, ncols_str: int
+    ):
+    """Decodes `nrows` rows between `start` and `end` of a file placed in
+    shared memory. Runs inside a worker process.
+
+    Args:
+        file (Path): the file itself; only used for error messages
+        shm_name (str): name of the shared memory block with the file bytes
+        start (int): offset of the first row of the chunk
+        end (int): offset right after the last row of the chunk
+        nrows (int): number of rows in the chunk
+        ncols_int (int): number of numeric columns
+        ncols_str (int): number of string columns
+
+    Returns:
+        list: the decoded rows of the chunk
+
+    """
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name = shm_name)
+    try:
+        chunk = bytes(shm.buf[start:end])
+    finally:
+        shm.close()
+    return get_rows(file, chunk, [], nrows, 0, ncols_int, ncols_str)
+
+
+def get_rows_parallel(
+    file: Path, bstr: bytes, tsv: list, nrows: int, offset: int,
+    ncols_int: int, ncols_str: int, workers: int
+    ):
+    """Same as `get_rows`, but splits the rows into chunks that are decoded
+    in `workers` processes. The file bytes are shared with the workers
+    through shared memory rather than copied to each of them.
+
+    Args:
+        file (Path): the file itself
+        bstr (bytes): the bytestring
+        tsv (list): the tsv in list form
+        nrows (int): number of rows
+        offset: offset to specify columns
+        ncols_int (int): number of numeric columns
+        ncols_str (int): number of string columns
+        workers (int): number of worker processes
+
+    Returns:
+        list: `tsv` with rows populated, in the same order as `get_rows`
+
+    Raises:
+        Exception: if the `.ies` file is corrupt or invalid
+
+    """
+    if workers <= 1 or nrows < PARALLEL_MIN_ROWS:
+        return get_rows(file, bstr, tsv, nrows, offset, ncols_int, ncols_str)
+
+    # Imported here so startup stays fast when nothing runs in parallel
+    from multiprocessing import shared_memory
+
+    try:
+        offsets = scan_row_offsets(bstr, nrows, offset, ncols_int, ncols_str)
+    except struct.error:
+        raise Exception(f'IES file {file} is invalid: rows are truncated')
+
+    chunk_rows = -(-nrows // workers)
+    shm = shared_memory.SharedMemory(create = True, size = len(bstr))
+    try:
+        shm.buf[:len(bstr)] = bstr
+        # The pool is shared by every file of a batch run
+        executor = get_pool(workers)
+        futures = [
+            executor.submit(
+                decode_row_chunk, file, shm.name,
+                offsets[i], offsets[min(i + chunk_rows, nrows)],
+                min(chunk_rows, nrows - i), ncols_int, ncols_str
+                )
+            for i
+            in range(0, nrows, chunk_rows)
+            ]
+        # futures are kept in submission order so rows stay in order
+        for future in futures:
+            tsv.extend(future.result())
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return tsv
+
+
+def read_numeric_columns(file: Path, structured: bool = True):
+    """Reads all numeric columns of a `file` into a NumPy array.
+    The float32 values are gathered from the row offsets in one vectorized
+    step and keep their original value (they are not truncated to `int`
+    like in the xml output). Requires NumPy.
+
+    Args:
+        file (Path): the file to read
+        structured (bool, optional): return a structured array with one
+            field per column; otherwise a 2-D float32 array and the column
+            names; defaults to True
+
+    Returns:
+        numpy.ndarray: the structured array with `nrows` records, or
+        tuple: (numpy.ndarray of shape (nrows, ncols_int), list of names)
+
+    Raises:
+        Exception: if the `.ies` file is corrupt or invalid, or column
+            names repeat when a structured array is requested
+
+    """
+    import numpy as np
+
+    bstr = file.read_bytes()
+    info = read_header(file, bstr, len(bstr))
+    nrows = info['nrows']
+    ncols_int = info['ncols_int']
+    col_names = get_col_names(
+        file, bstr, info['ncols'],
+        info['file_size'] - info['offset1'] - info['offset2'], ncols_int
+        )
+    names = [col_names[i] for i in range(ncols_int)]
+    if ncols_int == 0:
+        # A table of strings only - there are no float32 values to view
+        # as records, so the records are empty
+        if not structured:
+            return np.zeros((nrows, 0), dtype = '<f4'), names
+        return np.zeros(nrows, dtype = [])
+
+    starts = np.array(
+        scan_row_offsets(
+            bstr, nrows, info['file_size'] - info['offset2'],
+            ncols_int, info['ncols_str']
+            )[:-1],
+        dtype = np.int64
+        )
+    buf = np.frombuffer(bstr, dtype = np.uint8)
+    # The numeric block follows the 4 byte id and the `row_class` string.
+    class_len = buf[starts + 4].astype(np.int64) | (
+        buf[starts + 5].astype(np.int64) << 8
+        )
+    block_starts = starts + 6 + class_len
+    gathered = buf[
+        block_starts[:, None] + np.arange(4 * ncols_int, dtype = np.int64)
+        ]
+    values = np.ascontiguousarray(gathered).view('<f4').reshape(
+        nrows, ncols_int
+        )
+
+    if not structured:
+        return values, names
+    if len(set(names)) != len(names):
+        raise Exception(
+            f'IES file {file} has repeated numeric column names; '
+            f'use structured=False'
+            )
+    dtype = np.dtype([(name, '<f4') for name in names])
+    return values.view(dtype).reshape(nrows)
+
+
+def xml_bytes(tsv:list, header:str, backend = None):
+    """Converts the given tsv to a pretty printed xml document
 
     Args:
         tsv (list): the tsv to be converted
         header (str): the header to be displayed as the root
-        path (Path): the output path for the file(s)
+        backend (optional): the xml backend; defaults to `get_backend()`,
+            which uses lxml when it is installed. All backends write the
+            same bytes
+
+    Returns:
+        bytes: the xml document
+
     """
-    idspace = Element('idspace', {'id': header})
-    category = SubElement(idspace, 'Category')
+    if backend is None:
+        backend = get_backend()
+
+    idspace = backend.Element('idspace', {'id': header})
+    category = backend.SubElement(idspace, 'Category')
     columns = tsv[0]
     for row in tsv[1:]:
         attribs = {
@@ -233,10 +455,20 @@ def pretty_print_xml(tsv:list, header:str, path:Path):
             str(col): (str(val).strip() if str(val).strip() else 'None')
             for col, val in zip(columns, row)
         }
-        SubElement(category, 'Class', attrib=attribs)
-    # Pretty print and write xml
-    rough_string = tostring(idspace, encoding='utf-8', xml_declaration=False)
-    pretty_xml = parseString(rough_string).toprettyxml(indent='\t', encoding='utf-8')
+        backend.SubElement(category, 'Class', attrib=attribs)
+    return backend.pretty_bytes(idspace)
+
+def pretty_print_xml(tsv:list, header:str, path:Path, backend = None):
+    """Converts the given tsv to an xml file
+
+    Args:
+        tsv (list): the tsv to be converted
+        header (str): the header to be displayed as the root
+        path (Path): the output path for the file(s)
+        backend (optional): the xml backend; defaults to `get_backend()`
+
+    """
+    pretty_xml = xml_bytes(tsv, header, backend)
     
     with path.open('wb') as f:
         f.write(pretty_xml)
@@ -244,23 +476,25 @@ def pretty_print_xml(tsv:list, header:str, path:Path):
     
     
 
-def convert_file(file: Path, dest = None):
-    """Converts a `file` fully from bytes to string.
-    Optionally outputs to new file `dest`, if not run in batch mode.
-    (`dest` is not None.)
+def read_header(file: Path, bstr: bytes, length: int):
+    """Reads and validates the fixed size header of an `.ies` file.
 
     Args:
-        file (Path): the file to convert
-        dest (Path, optional): the destination output; defaults to None
+        file (Path): the file itself
+        bstr (bytes): the bytestring; only the first `HEADER_SIZE` bytes are used
+        length (int): the actual length of the file on disk
 
     Returns:
-        bool: True if successful; False otherwise
+        dict: the id space, offsets, file size and row/column counts
 
     Raises:
         Exception: if the `.ies` file is corrupt or invalid
 
     """
-    bstr = file.read_bytes()
+    if len(bstr) < HEADER_SIZE:
+        raise Exception(
+            f'IES file {file} is too short for a header: {len(bstr)}'
+            )
     header = bstr[0:128].decode(encoding='utf-8', errors='replace').rstrip(NULL_BYTE)
     header = clean_column_names(header)
     # Equivalent to original `val1`, `offset1`, `offset2`, and `filesize`.
@@ -271,9 +505,9 @@ def convert_file(file: Path, dest = None):
         for i
         in (128, 132, 136, 140)
         ]
-    if len(bstr) != file_size:
+    if length != file_size:
         raise Exception(
-            f'IES file {file} has invalid length specified: {len(bstr)}'
+            f'IES file {file} has invalid length specified: {length}'
             )
     # Aaron - Note that in xml2ies the value is not -1 here - it's possible that because
     # I changed the decoding to utf-8-sig that there might be an issue
@@ -298,11 +532,67 @@ def convert_file(file: Path, dest = None):
             f'{ncols}!={ncols_int}+{ncols_str}'
             )
 
+    return {
+        'idspace': header,
+        'offset1': offset1,
+        'offset2': offset2,
+        'file_size': file_size,
+        'nrows': nrows,
+        'ncols': ncols,
+        'ncols_int': ncols_int,
+        'ncols_str': ncols_str,
+        }
+
+
+def decode_file(file: Path, workers: int = 1, schema_cache = None, data = None):
+    """Decodes a `file` fully from bytes to string.
+
+    Args:
+        file (Path): the file to decode
+        workers (int, optional): worker processes used to decode the rows
+            of large tables; defaults to 1
+        schema_cache (SchemaCache, optional): records the column schema
+            of the id space; defaults to None
+        data (bytes, optional): the contents of the file when they are
+            already in memory; `file` is then only used in messages;
+            defaults to None
+
+    Returns:
+        tuple: the id space and the tsv in list form, column names first
+
+    Raises:
+        Exception: if the `.ies` file is corrupt or invalid
+
+    """
+    bstr = file.read_bytes() if data is None else data
+    info = read_header(file, bstr, len(bstr))
+    header = info['idspace']
+    file_size = info['file_size']
+    offset1 = info['offset1']
+    offset2 = info['offset2']
+    nrows = info['nrows']
+    ncols = info['ncols']
+    ncols_int = info['ncols_int']
+    ncols_str = info['ncols_str']
+
     # Equivalent to `ms.Seek`.`
     offset_idx = file_size - offset1 - offset2
 
     col_names = get_col_names(file, bstr, ncols, offset_idx, ncols_int)
 
+    if schema_cache is not None:
+        try:
+            columns = get_col_schema(bstr, ncols, offset_idx)
+        except ValueError as e:
+            # The rows decode without the column types and property access,
+            # so a value this port does not know only costs the schema.
+            columns = None
+            print(f'Not recording the schema of {file}: {e}')
+        # Columns sharing a short name collapse into one xml attribute,
+        # so such a schema could never match the xml.
+        if columns is not None and len({column.name for column in columns}) == ncols:
+            schema_cache.save(header, columns)
+
     tsv = []
 
     row = []
@@ -317,7 +607,35 @@ def convert_file(file: Path, dest = None):
 
     offset_idx = file_size - offset2 # equivalent to `ms.Seek`, line 89
 
-    tsv = get_rows(file, bstr, tsv, nrows, offset_idx, ncols_int, ncols_str)
+    tsv = get_rows_parallel(
+        file, bstr, tsv, nrows, offset_idx, ncols_int, ncols_str, workers
+        )
+    return header, tsv
+
+
+def convert_file(
+    file: Path, dest = None, workers: int = 1, schema_cache = None
+    ):
+    """Converts a `file` fully from bytes to string.
+    Optionally outputs to new file `dest`, if not run in batch mode.
+    (`dest` is not None.)
+
+    Args:
+        file (Path): the file to convert
+        dest (Path, optional): the destination output; defaults to None
+        workers (int, optional): worker processes used to decode the rows
+            of large tables; defaults to 1
+        schema_cache (SchemaCache, optional): records the column schema
+            of the id space; defaults to None
+
+    Returns:
+        bool: True if successful; False otherwise
+
+    Raises:
+        Exception: if the `.ies` file is corrupt or invalid
+
+    """
+    header, tsv = decode_file(file, workers, schema_cache)
     # old code used to create a tsv - skipping this altogether
     # out = Path(
     #     f'{file.stem}.tsv'
@@ -336,12 +654,14 @@ def convert_file(file: Path, dest = None):
     #     )
     
     # new path with xml data type
-    location = os.path.join(os.getcwd(), "xml_files") if dest is None else dest
-    if not os.path.isdir(location):
-        os.mkdir(location)
-        
-    # out_path = Path(f'{file.stem}.xml' if dest is None else dest)
-    out_path = Path(f'{location}/{file.stem}.xml') if dest is None else dest
+    if dest is None:
+        location = os.path.join(os.getcwd(), "xml_files")
+        # `exist_ok` so concurrent conversions do not race on the folder
+        os.makedirs(location, exist_ok = True)
+        out_path = Path(f'{location}/{file.stem}.xml')
+    else:
+        out_path = Path(dest)
+        out_path.parent.mkdir(parents = True, exist_ok = True)
     
         
     # pretty print the xml file
@@ -350,46 +670,433 @@ def convert_file(file: Path, dest = None):
     return True
 
 
-def batch_convert_dir(directory: Path):
-    """Traverses a `directory` with max-depth of 1 to convert all
-    `.ies` files.
+def merge_shards(manifest: Path, dest = None, workers: int = 1):
+    """Converts a table that `xml2ies.py --shard` split into several
+    `.ies` files back into a single xml file.
+
+    Args:
+        manifest (Path): the `.shards.json` manifest listing the shards
+        dest (Path, optional): the destination output; defaults to
+            `xml_files/<name>.xml` in the current directory
+        workers (int, optional): worker processes used to decode the rows
+            of large tables; defaults to 1
+
+    Returns:
+        bool: True if successful; False otherwise
+
+    Raises:
+        Exception: if a shard is invalid or does not match the others
+
+    """
+    shards = json.loads(manifest.read_text(encoding = 'utf-8'))
+    header = None
+    tsv = []
+    for shard in shards['shards']:
+        shard_header, shard_tsv = decode_file(
+            manifest.parent / shard['file'], workers
+            )
+        if header is None:
+            header = shard_header
+            tsv.append(shard_tsv[0])
+        elif shard_header != header or shard_tsv[0] != tsv[0]:
+            raise Exception(
+                f'Shard {shard["file"]} of {manifest} does not match '
+                f'the columns of the first shard'
+                )
+        tsv.extend(shard_tsv[1:])
+
+    if len(tsv) - 1 != shards['rows']:
+        raise Exception(
+            f'Shards of {manifest} have {len(tsv) - 1} rows, '
+            f'expected {shards["rows"]}'
+            )
+
+    if dest is None:
+        location = os.path.join(os.getcwd(), "xml_files")
+        os.makedirs(location, exist_ok = True)
+        name = manifest.name[:-len('.shards.json')]
+        out_path = Path(f'{location}/{name}.xml')
+    else:
+        out_path = Path(dest)
+        out_path.parent.mkdir(parents = True, exist_ok = True)
+
+    pretty_print_xml(tsv, header, out_path)
+
+    return True
+
+
+def batch_convert_dir(
+    directory: Path, workers: int = 1, schema_cache = None,
+    recursive: bool = False, output = None, jobs: int = 1
+    ):
+    """Traverses a `directory` with max-depth of 1 (or fully if
+    `recursive`) to convert all `.ies` files. The largest files are
+    converted first, and the output directory mirrors the input tree.
 
     Args:
         directory (Path): the directory itself (usually relative)
+        workers (int, optional): worker processes used to decode the rows
+            of large tables; defaults to 1
+        schema_cache (SchemaCache, optional): records the column schema
+            of each id space; defaults to None
+        recursive (bool, optional): also convert files in sub directories;
+            defaults to False
+        output (Path, optional): the output directory; defaults to
+            `xml_files` in the current directory
+        jobs (int, optional): number of files converted in parallel
+            processes; defaults to 1
 
     Returns:
         None
 
     """
     
-    ies_files = list(directory.glob('*.ies'))
+    from tqdm import tqdm
+
+    ies_files = find_files(directory, '*.ies', recursive)
     total_files = len(ies_files)
     print(f'Found {total_files} ies files')
+
+    location = Path(os.getcwd(), 'xml_files') if output is None else output
+    dests = [
+        mirror_path(file, directory, location, '.xml')
+        for file
+        in ies_files
+        ]
     
-    for file in tqdm(ies_files, desc='Converting .ies files to .xml', unit='file'):
-        try:
-            convert_file(file)
-        except Exception as e:
-            print(
-                f"""Exception caught: {e}'
-                {file} was subsequently skipped."""
-                )
+    if jobs <= 1:
+        for file, dest in tqdm(
+            zip(ies_files, dests), total = total_files,
+            desc = 'Converting .ies files to .xml', unit = 'file'
+            ):
+            try:
+                convert_file(file, dest, workers, schema_cache)
+            except Exception as e:
+                print(
+                    f"""Exception caught: {e}'
+                    {file} was subsequently skipped."""
+                    )
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
 
-    # for file in directory.glob('*.ies'):
-        # try:
-        #     convert_file(file)
-        # except Exception as e:
-        #     print(
-        #         f"""Exception caught: {e}'
-        #         {file} was subsequently skipped."""
-        #         )
+    with ProcessPoolExecutor(max_workers = jobs) as executor:
+        # Submitted largest first; the pool starts them in that order.
+        futures = {
+            executor.submit(convert_file, file, dest, workers, schema_cache): file
+            for file, dest
+            in zip(ies_files, dests)
+            }
+        for future in tqdm(
+            as_completed(futures), total = total_files,
+            desc = 'Converting .ies files to .xml', unit = 'file'
+            ):
+            try:
+                future.result()
+            except Exception as e:
+                print(
+                    f"""Exception caught: {e}'
+                    {futures[future]} was subsequently skipped."""
+                    )
     return
 
 
-if __name__ == "__main__":
-    args = parser.parse_args()
-    print(args.subcommand)
-    if args.subcommand == 'file':
-        convert_file(args.ies_file, args.output)
+def inspect_file(file: Path):
+    """Reads only the header and column block of a `file` and validates
+    its structure. No rows are decoded.
+
+    Args:
+        file (Path): the file to inspect
+
+    Returns:
+        dict: the catalog entry for the file; `valid` is False and `error`
+            holds the reason if the file is corrupt or invalid
+
+    """
+    entry = {
+        'file': str(file),
+        'valid': False,
+        'error': None,
+        }
+    try:
+        length = file.stat().st_size
+        with file.open('rb') as f:
+            info = read_header(file, f.read(HEADER_SIZE), length)
+            ncols = info['ncols']
+            col_offset = info['file_size'] - info['offset1'] - info['offset2']
+            if (col_offset < HEADER_SIZE
+                    or col_offset + ncols * COLUMN_SIZE > length):
+                raise Exception(
+                    f'IES file {file} has an invalid column offset: {col_offset}'
+                    )
+            f.seek(col_offset)
+            col_block = f.read(ncols * COLUMN_SIZE)
+        col_names = get_col_names(file, col_block, ncols, 0, info['ncols_int'])
+        if len(col_names) != ncols or any(
+                i not in col_names for i in range(ncols)):
+            raise Exception(
+                f'IES file {file} is invalid: column indices out of range'
+                )
+        entry.update(info)
+        entry['columns'] = [col_names[i] for i in range(ncols)]
+        entry['valid'] = True
+    except Exception as e:
+        entry['error'] = str(e)
+    return entry
+
+
+def batch_inspect(paths: list):
+    """Inspects all `paths`; directories are traversed with max-depth of 1.
+
+    Args:
+        paths (list): `.ies` files or directories with `.ies` files
+
+    Returns:
+        list: the catalog entries, one per file
+
+    """
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(path.glob('*.ies')))
+        else:
+            files.append(path)
+    return [inspect_file(file) for file in files]
+
+
+def write_catalog(catalog: list, fmt: str = 'json', dest = None):
+    """Writes the catalog from `batch_inspect` as json or tsv.
+
+    Args:
+        catalog (list): the catalog entries
+        fmt (str, optional): either 'json' or 'tsv'; defaults to 'json'
+        dest (Path, optional): the destination output; defaults to stdout
+
+    Returns:
+        None
+
+    """
+    if fmt == 'json':
+        text = json.dumps(catalog, indent = '\t', ensure_ascii = False)
+    else:
+        fields = [
+            'file', 'valid', 'idspace', 'nrows', 'ncols',
+            'ncols_int', 'ncols_str', 'file_size', 'columns', 'error'
+            ]
+        lines = [SEPARATOR.join(fields)]
+        for entry in catalog:
+            values = []
+            for field in fields:
+                value = entry.get(field)
+                if field == 'columns' and value is not None:
+                    value = ','.join(value)
+                values.append('' if value is None else str(value))
+            lines.append(SEPARATOR.join(values))
+        text = LINE.join(lines)
+
+    if dest is None:
+        print(text)
     else:
-        batch_convert_dir(args.directory)
+        dest.write_text(text + LINE, encoding = 'utf-8')
+
+
+def build_parser(prog = None):
+    """Builds the command line parser. Nothing is built at import time,
+    so the module can be imported without side effects.
+
+    Args:
+        prog (str, optional): the program name shown in the usage;
+            defaults to the script name
+
+    Returns:
+        argparse.ArgumentParser: the parser
+
+    """
+    parser = argparse.ArgumentParser(
+        prog = prog,
+        description = 'An .ies file to xml converter'
+        )
+    subparser = parser.add_subparsers(
+        help = 'subcommand help',
+        required = True,
+        dest = 'subcommand'
+        )
+
+    parser_file = subparser.add_parser(
+        'file',
+        help = 'file help'
+        )
+    parser_file.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'An optional file to output to; overrides default file name',
+        type = Path
+        )
+    parser_file.add_argument(
+        '--verbose', '-v',
+        action = 'store_true',
+        help = 'Print string cache statistics when done'
+        )
+    parser_file.add_argument(
+        '--schema-cache',
+        required = False,
+        help = 'An optional directory to record the column schema of each id space in',
+        type = Path
+        )
+    parser_file.add_argument(
+        '--workers', '-j',
+        required = False,
+        default = 1,
+        help = 'Number of worker processes used to decode rows of large tables',
+        type = int
+        )
+    parser_file.add_argument(
+        'ies_file',
+        help = 'The .ies file to convert',
+        type = Path
+        )
+
+    parser_batch = subparser.add_parser(
+        'batch',
+        help = 'batch help'
+        )
+    parser_batch.add_argument(
+        '--verbose', '-v',
+        action = 'store_true',
+        help = 'Print string cache statistics when done'
+        )
+    parser_batch.add_argument(
+        '--schema-cache',
+        required = False,
+        help = 'An optional directory to record the column schema of each id space in',
+        type = Path
+        )
+    parser_batch.add_argument(
+        '--workers', '-j',
+        required = False,
+        default = 1,
+        help = 'Number of worker processes used to decode rows of large tables',
+        type = int
+        )
+    parser_batch.add_argument(
+        '--recursive', '-r',
+        action = 'store_true',
+        help = 'Also convert .ies files in sub directories'
+        )
+    parser_batch.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'An optional output directory; mirrors the input directory tree',
+        type = Path
+        )
+    parser_batch.add_argument(
+        '--jobs', '-p',
+        required = False,
+        default = 1,
+        help = 'Number of files converted in parallel processes',
+        type = int
+        )
+    parser_batch.add_argument(
+        'directory',
+        help = 'The directory with .ies files to batch convert',
+        type = Path
+        )
+
+    parser_merge = subparser.add_parser(
+        'merge',
+        help = 'merge help'
+        )
+    parser_merge.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'An optional file to output to; overrides default file name',
+        type = Path
+        )
+    parser_merge.add_argument(
+        '--workers', '-j',
+        required = False,
+        default = 1,
+        help = 'Number of worker processes used to decode rows of large tables',
+        type = int
+        )
+    parser_merge.add_argument(
+        'manifest',
+        help = 'The .shards.json manifest written by xml2ies.py --shard',
+        type = Path
+        )
+
+    parser_inspect = subparser.add_parser(
+        'inspect',
+        help = 'inspect help'
+        )
+    parser_inspect.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'An optional file to write the catalog to; defaults to stdout',
+        type = Path
+        )
+    parser_inspect.add_argument(
+        '--format', '-f',
+        required = False,
+        default = 'json',
+        choices = ['json', 'tsv'],
+        help = 'The catalog format',
+        )
+    parser_inspect.add_argument(
+        'paths',
+        nargs = '+',
+        help = 'The .ies files or directories with .ies files to inspect',
+        type = Path
+        )
+
+    return parser
+
+
+def main(argv = None, prog = None):
+    """Runs the command line interface.
+
+    Args:
+        argv (list, optional): the arguments without the program name;
+            defaults to `sys.argv[1:]`
+        prog (str, optional): the program name shown in the usage;
+            defaults to the script name
+
+    Returns:
+        None
+
+    """
+    args = build_parser(prog).parse_args(argv)
+    if args.subcommand == 'inspect':
+        # The catalog may go to stdout, so nothing else is printed here
+        catalog = batch_inspect(args.paths)
+        write_catalog(catalog, args.format, args.output)
+        if not all(entry['valid'] for entry in catalog):
+            raise SystemExit(1)
+    elif args.subcommand == 'merge':
+        print(args.subcommand)
+        merge_shards(args.manifest, args.output, args.workers)
+    else:
+        print(args.subcommand)
+        schema_cache = (
+            SchemaCache(args.schema_cache)
+            if args.schema_cache is not None
+            else None
+            )
+        if args.subcommand == 'file':
+            convert_file(
+                args.ies_file, args.output, args.workers, schema_cache
+                )
+        else:
+            batch_convert_dir(
+                args.directory, args.workers, schema_cache,
+                args.recursive, args.output, args.jobs
+                )
+        if args.verbose:
+            # Rows decoded by worker processes are not counted here
+            print(format_cache_info(
+                'String cache', convert_bytestring.cache_info()
+                ))
+
+
+if __name__ == "__main__":
+    main()
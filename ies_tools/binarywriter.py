@@ -1,7 +1,39 @@
 import io
 import struct
+from functools import lru_cache
 from pathlib import Path
 
+# Upper bound on the number of distinct strings kept by encode_xor_lp_str
+STRING_CACHE_SIZE = 65536
+
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def encode_xor_lp_str(value: str) -> bytes:
+    """ Encodes a string the way write_xor_lp_str writes it - a UTF-8 length prefix followed by the XOR'd bytes
+        Results are cached since tables repeat the same strings constantly; see encode_xor_lp_str.cache_info()
+
+    Args:
+        value (str): The string to encode
+
+    Returns:
+        bytes: The length prefixed XOR'd string
+    """
+    encoded = value.encode('utf-8', errors='replace')
+    return struct.pack('<H', len(encoded)) + bytes(b ^ 1 for b in encoded)
+
+def format_cache_info(name: str, info) -> str:
+    """ Formats the statistics of an lru_cache for verbose output
+
+    Args:
+        name (str): The name to display
+        info (CacheInfo): The result of cache_info()
+
+    Returns:
+        str: The hits, misses, hit rate and size of the cache
+    """
+    lookups = info.hits + info.misses
+    rate = info.hits / lookups if lookups else 0.0
+    return f'{name}: {info.hits} hits, {info.misses} misses ({rate:.1%} hit rate), {info.currsize}/{info.maxsize} entries'
+
 class BinaryWriterTools:
 
     __XOR_KEY: int = 1
@@ -70,9 +102,7 @@ class BinaryWriterTools:
         Args:
             output (str): The output to be XOR'd and written to the buffer 
         """
-        byte_length = len(self.__encode_str__(output))
-        self.writer.write(struct.pack('<H', byte_length))
-        self.write_xored_fixed_string(output, byte_length)
+        self.writer.write(encode_xor_lp_str(output))
         
 
     def write_xored_fixed_string(self,output: str, length: int):
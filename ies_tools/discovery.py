@@ -0,0 +1,34 @@
+from pathlib import Path
+
+def find_files(directory: Path, pattern: str, recursive: bool = False) -> list[Path]:
+    """Finds the files to batch convert, largest first
+        Starting the largest tables first keeps a parallel run from ending with one big table running alone
+
+    Args:
+        directory (Path): The directory to search
+        pattern (str): The glob pattern of the files, e.g. '*.ies'
+        recursive (bool, optional): Search all sub directories as well. Defaults to False.
+
+    Returns:
+        list[Path]: The files sorted by size, largest first
+    """
+    files = directory.rglob(pattern) if recursive else directory.glob(pattern)
+    sized_files = [(file.stat().st_size, file) for file in files if file.is_file()]
+    # Ties are broken by path so the order is the same on every run
+    sized_files.sort(key=lambda sized_file: (-sized_file[0], str(sized_file[1])))
+    return [file for _, file in sized_files]
+
+def mirror_path(file: Path, directory: Path, output_directory: Path, suffix: str) -> Path:
+    """Gets the output path of a file so the output directory mirrors the input directory tree
+        Files with the same name in different sub directories therefore do not overwrite each other
+
+    Args:
+        file (Path): The input file inside directory
+        directory (Path): The input directory that was searched
+        output_directory (Path): The output directory
+        suffix (str): The suffix of the output file, e.g. '.xml'
+
+    Returns:
+        Path: The output path of the file
+    """
+    return output_directory / file.relative_to(directory).with_suffix(suffix)
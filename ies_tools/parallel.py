@@ -0,0 +1,27 @@
+import threading
+
+# Tables with fewer rows are not worth handing to worker processes
+PARALLEL_MIN_ROWS = 20000
+
+# The pools started by get_pool by number of workers
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+def get_pool(workers: int):
+    """Gets the process pool that encodes or decodes the rows of large tables
+        There is one pool per number of workers in each process. It is started on first use and kept
+        until the process exits, so a batch run starts its workers once rather than once per file
+
+    Args:
+        workers (int): The number of worker processes
+
+    Returns:
+        ProcessPoolExecutor: The pool, shared by every caller in this process and safe to submit to from several threads
+    """
+    with POOLS_LOCK:
+        pool = POOLS.get(workers)
+        if pool is None:
+            # Imported here so startup stays fast when nothing runs in parallel
+            from concurrent.futures import ProcessPoolExecutor
+            pool = POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
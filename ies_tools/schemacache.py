@@ -0,0 +1,106 @@
+import json
+import re
+import threading
+from pathlib import Path
+from ies_tools.columntype import ColumnType as CT
+from ies_tools.iescolumn import IesColumn
+from ies_tools.propertyaccess import PropertyAccess as PA
+
+class SchemaCache:
+    """Stores the column schema of each id space as a json file so the column types
+       do not have to be inferred again every time a table is converted
+       One cache can be shared by conversions running on several threads
+    """
+
+    __SUFFIX: str = ".schema.json"
+
+    def __init__(self, directory: Path):
+        """
+        Args:
+            directory (Path): The directory the schema files are kept in. Created on the first save
+        """
+        self.directory = Path(directory)
+        self.__schemas: dict[str, list[IesColumn]] = {}
+        self.__lock = threading.Lock()
+
+    def __reduce__(self):
+        """Pickles only the directory so the cache can be handed to worker processes, which load schemas on their own
+
+        Returns:
+            tuple: The class and its constructor arguments
+        """
+        return (SchemaCache, (self.directory,))
+
+    def __path__(self, id_space: str) -> Path:
+        """Gets the path of the schema file for the id space
+
+        Args:
+            id_space (str): The id space of the table
+
+        Returns:
+            Path: The schema file path
+        """
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', id_space)
+        return self.directory / f'{safe_name}{self.__SUFFIX}'
+
+    def load(self, id_space: str) -> list[IesColumn] | None:
+        """Loads the columns recorded for the id space
+
+        Args:
+            id_space (str): The id space of the table
+
+        Returns:
+            list[IesColumn] | None: New column objects in declaration order, None if nothing has been recorded
+        """
+        with self.__lock:
+            if id_space not in self.__schemas:
+                path = self.__path__(id_space)
+                if not path.is_file():
+                    return None
+                data = json.loads(path.read_text(encoding='utf-8'))
+                columns: list[IesColumn] = []
+                for entry in data['columns']:
+                    column = IesColumn()
+                    column.column = entry['column']
+                    column.name = entry['name']
+                    column.column_type = CT(entry['type'])
+                    column.property_access = PA(entry['access'])
+                    column.sync = entry['sync']
+                    column.declaration_index = entry['declaration_index']
+                    columns.append(column)
+                self.__schemas[id_space] = columns
+            cached_columns = self.__schemas[id_space]
+
+        # Copies are handed out so the cached columns cannot be changed by the caller
+        copies: list[IesColumn] = []
+        for cached in cached_columns:
+            column = IesColumn()
+            column.__dict__.update(cached.__dict__)
+            copies.append(column)
+        return copies
+
+    def save(self, id_space: str, columns: list[IesColumn]):
+        """Records the columns for the id space, replacing anything recorded before
+
+        Args:
+            id_space (str): The id space of the table
+            columns (list[IesColumn]): The columns in the order they are written to the .ies file
+        """
+        data = {
+            'idspace': id_space,
+            'columns': [
+                {
+                    'column': column.column,
+                    'name': column.name,
+                    'type': column.column_type.value,
+                    'access': column.property_access.value,
+                    'sync': int(column.sync),
+                    'declaration_index': column.declaration_index,
+                }
+                for column in columns
+            ]
+        }
+        with self.__lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.__path__(id_space).write_text(json.dumps(data, indent='\t'), encoding='utf-8')
+            self.__schemas.pop(id_space, None)
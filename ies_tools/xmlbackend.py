@@ -0,0 +1,140 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO
+
+# Environment variable that picks the backend: auto (default), stdlib or lxml.
+# Being an environment variable it also reaches worker processes
+XML_BACKEND_ENV = "IES_XML_BACKEND"
+XML_DECLARATION = b'<?xml version="1.0" encoding="utf-8"?>\n'
+
+class StdlibXmlBackend:
+    """Parses with xml.etree.ElementTree and pretty prints through xml.dom.minidom
+    """
+
+    name: str = "stdlib"
+
+    def __init__(self):
+        import xml.etree.ElementTree as ET
+        from xml.dom.minidom import parseString
+        self.__ET = ET
+        self.__parse_string = parseString
+        self.Element = ET.Element
+        self.SubElement = ET.SubElement
+        self.ElementTree = ET.ElementTree
+
+    def iterparse(self, source: Path | BinaryIO):
+        """Parses incrementally, yielding each element once it has been read completely
+
+        Args:
+            source (Path | BinaryIO): The xml file path or a readable stream
+
+        Returns:
+            iterator: (event, element) pairs; its root attribute holds the root element once parsing is done
+        """
+        return self.__ET.iterparse(source, events=('end',))
+
+    def pretty_bytes(self, root) -> bytes:
+        """Serializes an element tree indented with tabs, with an utf-8 xml declaration
+
+        Args:
+            root (Element): The root element
+
+        Returns:
+            bytes: The document
+        """
+        rough_string = self.__ET.tostring(root, encoding='utf-8', xml_declaration=False)
+        return self.__parse_string(rough_string).toprettyxml(indent='\t', encoding='utf-8')
+
+
+class LxmlXmlBackend:
+    """Parses and serializes with lxml, which does the work in C.
+        The output bytes are the same as those of StdlibXmlBackend
+    """
+
+    name: str = "lxml"
+
+    def __init__(self):
+        from lxml import etree
+        self.__etree = etree
+        self.Element = etree.Element
+        self.SubElement = etree.SubElement
+        self.ElementTree = etree.ElementTree
+
+    def iterparse(self, source: Path | BinaryIO):
+        """Parses incrementally, yielding each element once it has been read completely
+
+        Args:
+            source (Path | BinaryIO): The xml file path or a readable stream
+
+        Returns:
+            iterator: (event, element) pairs; its root attribute holds the root element once parsing is done
+        """
+        if isinstance(source, Path):
+            source = str(source)
+        # Comments are dropped and entities are not fetched from outside, as with ElementTree
+        resolve_entities = 'internal' if self.__etree.LXML_VERSION >= (5,) else False
+        return self.__etree.iterparse(
+            source, events=('end',), remove_comments=True, resolve_entities=resolve_entities, huge_tree=True
+        )
+
+    def pretty_bytes(self, root) -> bytes:
+        """Serializes an element tree indented with tabs, with an utf-8 xml declaration
+
+        Args:
+            root (Element): The root element
+
+        Returns:
+            bytes: The document
+        """
+        self.__etree.indent(root, space='\t')
+        body = self.__etree.tostring(root, encoding='utf-8')
+        # minidom writes tabs and line breaks inside attribute values as they are, lxml as character references.
+        # A literal "&#10;" in a value is written as "&amp;#10;", so only real references are replaced
+        body = body.replace(b'&#9;', b'\t').replace(b'&#10;', b'\n').replace(b'&#13;', b'\r')
+        return XML_DECLARATION + body + b'\n'
+
+
+BACKENDS = {
+    StdlibXmlBackend.name: StdlibXmlBackend,
+    LxmlXmlBackend.name: LxmlXmlBackend,
+}
+
+def get_backend(name: str | None = None) -> StdlibXmlBackend | LxmlXmlBackend:
+    """Gets the xml backend
+
+    Args:
+        name (str | None, optional): auto, stdlib or lxml. auto picks lxml when it is installed and
+            the standard library otherwise. Defaults to the IES_XML_BACKEND environment variable, then auto.
+
+    Raises:
+        ValueError: If the name is unknown
+        ImportError: If lxml was asked for but is not installed
+
+    Returns:
+        StdlibXmlBackend | LxmlXmlBackend: The backend
+    """
+    return load_backend((name or os.environ.get(XML_BACKEND_ENV) or "auto").lower())
+
+@lru_cache(maxsize=None)
+def load_backend(name: str) -> StdlibXmlBackend | LxmlXmlBackend:
+    """Creates a backend once per process
+
+    Args:
+        name (str): auto, stdlib or lxml
+
+    Raises:
+        ValueError: If the name is unknown
+        ImportError: If lxml was asked for but is not installed
+
+    Returns:
+        StdlibXmlBackend | LxmlXmlBackend: The backend
+    """
+    if name == "auto":
+        try:
+            return LxmlXmlBackend()
+        except ImportError:
+            return StdlibXmlBackend()
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown xml backend {name} - expected auto, {", ".join(BACKENDS)}')
+    return BACKENDS[name]()
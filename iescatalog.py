@@ -0,0 +1,613 @@
+import json
+import struct
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+from ies_tools.discovery import find_files
+from ies2xml import (
+    convert_bytestring, get_col_names, get_rows, read_header, scan_row_offsets
+)
+
+CatalogInfo = namedtuple('CatalogInfo', ['hits', 'misses', 'evictions', 'tables', 'currsize', 'maxsize', 'shared'])
+
+# Serializes attach_untracked_before_3_13, so only one replacement of resource_tracker.register is in place at a time
+REGISTER_LOCK = threading.Lock()
+
+def attach_shared_memory(name: str):
+    """Attaches to an existing shared memory block without registering it with this process's resource tracker
+
+        A registered block is unlinked when the process exits, which would free a table other processes still use.
+        Python 3.13 attaches untracked with track=False; older versions go through attach_untracked_before_3_13
+
+    Args:
+        name (str): The name of the block
+
+    Raises:
+        FileNotFoundError: If no block has the name
+
+    Returns:
+        SharedMemory: The attached block
+    """
+    from multiprocessing import shared_memory
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return attach_untracked_before_3_13(name)
+
+def attach_untracked_before_3_13(name: str):
+    """Fallback of attach_shared_memory for Python before 3.13, where SharedMemory always registers the block
+
+        There is no option to skip the registration, and undoing it with unregister is wrong as well: pool workers
+        share the tracker of their parent, so that would also drop the registration of the process that created
+        the block. Instead resource_tracker.register is replaced for the duration of the attach, under REGISTER_LOCK.
+        The replacement only drops the call this thread makes for this block; every other registration, from this
+        thread or any other, is passed on, so SharedMemory created concurrently elsewhere is tracked as usual
+
+    Args:
+        name (str): The name of the block
+
+    Raises:
+        FileNotFoundError: If no block has the name
+
+    Returns:
+        SharedMemory: The attached block
+    """
+    from multiprocessing import resource_tracker, shared_memory
+    attaching_thread = threading.get_ident()
+
+    with REGISTER_LOCK:
+        register = resource_tracker.register
+        def register_others(resource_name: str, resource_type: str):
+            if (threading.get_ident() != attaching_thread or resource_type != 'shared_memory'
+                    or resource_name.lstrip('/') != name.lstrip('/')):
+                register(resource_name, resource_type)
+
+        resource_tracker.register = register_others
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+class TableLookups(ABC):
+    """
+        Finds rows by ClassName or ClassID. The indexes are built on first use from
+        the ClassID and ClassName stored in front of each row
+    """
+
+    def __init__(self):
+        self.__ids: dict[int, int] | None = None
+        self.__names: dict[str, int] | None = None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """The number of rows in the table"""
+
+    @abstractmethod
+    def row(self, index: int) -> dict[str, int | str]:
+        """Decodes a single row
+
+        Args:
+            index (int): The index of the row
+
+        Returns:
+            dict[str, int | str]: The row values by column name
+        """
+
+    @abstractmethod
+    def __class_id_at__(self, index: int) -> int:
+        """Reads the ClassID stored in front of a row
+
+        Args:
+            index (int): The index of the row
+
+        Returns:
+            int: The ClassID
+        """
+
+    @abstractmethod
+    def __class_name_at__(self, index: int) -> str:
+        """Reads the ClassName stored in front of a row
+
+        Args:
+            index (int): The index of the row
+
+        Returns:
+            str: The ClassName
+        """
+
+    def __contains__(self, class_name: str) -> bool:
+        return class_name in self.__name_index__()
+
+    def __getitem__(self, class_name: str) -> dict[str, int | str]:
+        """Gets a row by its ClassName
+
+        Args:
+            class_name (str): The ClassName of the row
+
+        Raises:
+            KeyError: If no row has the ClassName
+
+        Returns:
+            dict[str, int | str]: The row values by column name, as ies2xml writes them to the xml
+        """
+        return self.row(self.__name_index__()[class_name])
+
+    def get(self, class_name: str, default=None) -> dict[str, int | str] | None:
+        """Gets a row by its ClassName
+
+        Args:
+            class_name (str): The ClassName of the row
+            default (optional): Returned if no row has the ClassName. Defaults to None.
+
+        Returns:
+            dict[str, int | str] | None: The row values by column name, or default
+        """
+        index = self.__name_index__().get(class_name)
+        return default if index is None else self.row(index)
+
+    def by_id(self, class_id: int) -> dict[str, int | str]:
+        """Gets a row by its ClassID
+
+        Args:
+            class_id (int): The ClassID of the row
+
+        Raises:
+            KeyError: If no row has the ClassID
+
+        Returns:
+            dict[str, int | str]: The row values by column name
+        """
+        if self.__ids is None:
+            self.__ids = {}
+            for index in range(len(self)):
+                self.__ids.setdefault(self.__class_id_at__(index), index)
+        return self.row(self.__ids[class_id])
+
+    def class_names(self) -> list[str]:
+        """Gets the ClassName of every row in file order
+
+        Returns:
+            list[str]: The ClassNames
+        """
+        return list(self.__name_index__())
+
+    def __name_index__(self) -> dict[str, int]:
+        """Builds the ClassName index
+
+        Returns:
+            dict[str, int]: The index of the first row with each ClassName
+        """
+        if self.__names is None:
+            self.__names = {}
+            for index in range(len(self)):
+                self.__names.setdefault(self.__class_name_at__(index), index)
+        return self.__names
+
+
+class IesTable(TableLookups):
+    """
+        One opened .ies table. Only the raw bytes and the row offsets are kept; a row is decoded
+        when it is looked up, and the ClassName and ClassID indexes are built on first use
+    """
+
+    def __init__(self, file: Path):
+        """
+        Args:
+            file (Path): The .ies file
+
+        Raises:
+            Exception: If the .ies file is corrupt or invalid
+        """
+        super().__init__()
+        self.file = Path(file)
+        self.__data = self.file.read_bytes()
+        info = read_header(self.file, self.__data, len(self.__data))
+        self.id_space: str = info['idspace']
+        self.__ncols_int: int = info['ncols_int']
+        self.__ncols_str: int = info['ncols_str']
+        col_names = get_col_names(
+            self.file, self.__data, info['ncols'],
+            info['file_size'] - info['offset1'] - info['offset2'], self.__ncols_int
+        )
+        # Numeric columns first, then string columns, the order values are stored in a row
+        self.columns: list[str] = [str(col_names[i]) for i in range(info['ncols'])]
+        self.__row_offsets: list[int] = scan_row_offsets(
+            self.__data, info['nrows'], info['file_size'] - info['offset2'], self.__ncols_int, self.__ncols_str
+        )
+
+    @property
+    def size(self) -> int:
+        """The approximate memory held by the table in bytes"""
+        # The raw bytes plus one offset and one index entry per row
+        return len(self.__data) + 3 * 8 * len(self.__row_offsets)
+
+    def __len__(self) -> int:
+        return len(self.__row_offsets) - 1
+
+    def row(self, index: int) -> dict[str, int | str]:
+        """Decodes a single row
+
+        Args:
+            index (int): The index of the row
+
+        Returns:
+            dict[str, int | str]: The row values by column name
+        """
+        values = get_rows(
+            self.file, self.__data, [], 1, self.__row_offsets[index], self.__ncols_int, self.__ncols_str
+        )[0]
+        return dict(zip(self.columns, values))
+
+    def __class_id_at__(self, index: int) -> int:
+        return struct.unpack_from('<i', self.__data, self.__row_offsets[index])[0]
+
+    def __class_name_at__(self, index: int) -> str:
+        offset = self.__row_offsets[index] + 4
+        length = struct.unpack_from('<H', self.__data, offset)[0]
+        return convert_bytestring(self.__data[offset + 2:offset + 2 + length])
+
+
+class SharedIesTable(TableLookups):
+    """
+        A table decoded once into a shared memory block that any process can attach to read-only.
+        The block holds the ClassIDs, the numeric values as one float32 block, and all strings
+        already decoded to utf-8 in one pool with their offsets, so attaching costs no decoding.
+        Pickling a table (e.g. handing it to a worker process) attaches to the same block
+    """
+
+    __MAGIC: bytes = b'IESSHM1\x00'
+
+    def __init__(self, name: str, owner: bool = False):
+        """Attaches to a published table. Use publish to create one
+
+        Args:
+            name (str): The name of the shared memory block
+            owner (bool, optional): Whether close also frees the block. Defaults to False.
+
+        Raises:
+            Exception: If the block does not hold a table
+        """
+        super().__init__()
+        from multiprocessing import shared_memory
+        # The owner keeps the block registered, so it is freed even if the owner dies without closing it
+        self.__shm = shared_memory.SharedMemory(name=name) if owner else attach_shared_memory(name)
+        self.name: str = self.__shm.name
+        self.owner = owner
+        # Nothing writes to a published table, so every process reads it through a read-only view
+        self.__buf = buf = self.__shm.buf.toreadonly()
+        if bytes(buf[:8]) != self.__MAGIC:
+            self.__buf.release()
+            self.__shm.close()
+            raise Exception(f'Shared memory block {name} does not hold an .ies table')
+        meta_size = struct.unpack_from('<I', buf, 8)[0]
+        meta = json.loads(bytes(buf[12:12 + meta_size]).decode('utf-8'))
+        self.file = Path(meta['file'])
+        self.id_space: str = meta['idspace']
+        self.columns: list[str] = meta['columns']
+        self.__nrows: int = meta['nrows']
+        self.__ncols_int: int = meta['ncols_int']
+        self.__ncols_str: int = len(self.columns) - self.__ncols_int
+        self.__ids_offset: int = meta['ids']
+        self.__numbers_offset: int = meta['numbers']
+        self.__strings_offset: int = meta['strings']
+        self.__pool_offset: int = meta['pool']
+        self.__row_numbers = struct.Struct(f'<{self.__ncols_int}f')
+        self.__row_strings = struct.Struct(f'<{self.__ncols_str + 2}I')
+
+    @classmethod
+    def publish(cls, file: Path) -> 'SharedIesTable':
+        """Decodes an .ies file into a new shared memory block
+
+        Args:
+            file (Path): The .ies file
+
+        Raises:
+            Exception: If the .ies file is corrupt or invalid
+
+        Returns:
+            SharedIesTable: The table, owning the block; close it when the workers are done
+        """
+        from multiprocessing import shared_memory
+        file = Path(file)
+        data = file.read_bytes()
+        info = read_header(file, data, len(data))
+        nrows, ncols_int, ncols_str = info['nrows'], info['ncols_int'], info['ncols_str']
+        col_names = get_col_names(
+            file, data, info['ncols'], info['file_size'] - info['offset1'] - info['offset2'], ncols_int
+        )
+
+        ids = bytearray()
+        numbers = bytearray()
+        pool = bytearray()
+        # Per row the ClassName and each string column, plus the end of the pool
+        string_offsets = []
+        offset = info['file_size'] - info['offset2']
+        for _ in range(nrows):
+            ids += data[offset:offset + 4]
+            offset += 4
+            length = struct.unpack_from('<H', data, offset)[0]
+            string_offsets.append(len(pool))
+            pool += convert_bytestring(data[offset + 2:offset + 2 + length]).encode('utf-8')
+            offset += 2 + length
+            # The numeric values of a row are stored next to each other and are copied as they are
+            numbers += data[offset:offset + 4 * ncols_int]
+            offset += 4 * ncols_int
+            for _ in range(ncols_str):
+                length = struct.unpack_from('<H', data, offset)[0]
+                string_offsets.append(len(pool))
+                pool += convert_bytestring(data[offset + 2:offset + 2 + length]).encode('utf-8')
+                offset += 2 + length
+            offset += ncols_str
+        string_offsets.append(len(pool))
+
+        meta = {
+            'file': str(file),
+            'idspace': info['idspace'],
+            'columns': [str(col_names[i]) for i in range(info['ncols'])],
+            'nrows': nrows,
+            'ncols_int': ncols_int,
+        }
+        # Offsets are only known once the metadata size is, so it is sized with placeholders first
+        placeholders = dict(meta, ids=0xFFFFFFFF, numbers=0xFFFFFFFF, strings=0xFFFFFFFF, pool=0xFFFFFFFF)
+        start = 12 + len(json.dumps(placeholders).encode('utf-8'))
+        start += -start % 4
+        meta['ids'] = start
+        meta['numbers'] = meta['ids'] + len(ids)
+        meta['strings'] = meta['numbers'] + len(numbers)
+        meta['pool'] = meta['strings'] + 4 * len(string_offsets)
+        meta_bytes = json.dumps(meta).encode('utf-8')
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, meta['pool'] + len(pool)))
+        try:
+            buf = shm.buf
+            buf[:8] = cls.__MAGIC
+            struct.pack_into('<I', buf, 8, len(meta_bytes))
+            buf[12:12 + len(meta_bytes)] = meta_bytes
+            buf[meta['ids']:meta['numbers']] = ids
+            buf[meta['numbers']:meta['strings']] = numbers
+            struct.pack_into(f'<{len(string_offsets)}I', buf, meta['strings'], *string_offsets)
+            buf[meta['pool']:meta['pool'] + len(pool)] = pool
+            del buf
+            table = cls(shm.name, owner=True)
+        finally:
+            shm.close()
+        return table
+
+    def __reduce__(self):
+        """Pickles only the block name, so the receiving process attaches to the same memory
+
+        Returns:
+            tuple: The class and its constructor arguments
+        """
+        return (SharedIesTable, (self.name,))
+
+    @property
+    def size(self) -> int:
+        """The size of the shared memory block in bytes"""
+        return self.__shm.size
+
+    def __len__(self) -> int:
+        return self.__nrows
+
+    def row(self, index: int) -> dict[str, int | str]:
+        """Reads a single row
+
+        Args:
+            index (int): The index of the row
+
+        Returns:
+            dict[str, int | str]: The row values by column name, the same values IesTable.row gives
+        """
+        if not 0 <= index < self.__nrows:
+            raise IndexError(f'{self.file} has no row {index}')
+        buf = self.__buf
+        numbers = self.__row_numbers.unpack_from(buf, self.__numbers_offset + 4 * self.__ncols_int * index)
+        # The ClassName comes first in each row's offsets, then one per string column, then the next row's start
+        bounds = self.__row_strings.unpack_from(buf, self.__strings_offset + 4 * (self.__ncols_str + 1) * index)
+        pool = self.__pool_offset
+        strings = [bytes(buf[pool + bounds[i]:pool + bounds[i + 1]]).decode('utf-8') for i in range(1, self.__ncols_str + 1)]
+        # Numbers are truncated to integers, as get_rows does
+        return dict(zip(self.columns, [int(value) for value in numbers] + strings))
+
+    def __class_id_at__(self, index: int) -> int:
+        return struct.unpack_from('<i', self.__buf, self.__ids_offset + 4 * index)[0]
+
+    def __class_name_at__(self, index: int) -> str:
+        start, end = struct.unpack_from('<2I', self.__buf, self.__strings_offset + 4 * (self.__ncols_str + 1) * index)
+        return bytes(self.__buf[self.__pool_offset + start:self.__pool_offset + end]).decode('utf-8')
+
+    def close(self):
+        """Detaches from the block. The owner frees it as well, after which it can no longer be attached"""
+        self.__buf.release()
+        self.__shm.close()
+        if self.owner:
+            self.__shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class IesCatalog:
+    """
+        Gives access to all .ies tables of a directory by name, e.g. catalog['Item']['Sword_1'].
+        Tables are opened on first access and kept in a least recently used cache bounded by memory,
+        so cross references over many tables do not read the same file again and again.
+        One catalog can be shared by several threads.
+
+        Tables used by many worker processes can be published once to shared memory with share.
+        A catalog handed to a worker process attaches to those tables instead of decoding its own copy
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 256 * 1024 * 1024, recursive: bool = False,
+                 shared: dict[str, str] | None = None):
+        """
+        Args:
+            directory (Path): The directory containing the .ies files
+            max_bytes (int, optional): The memory the open tables may use before the least recently used
+                are closed. The most recent table is always kept. Defaults to 256 MiB.
+            recursive (bool, optional): Include .ies files in sub directories, named by their relative path
+                without suffix, e.g. 'sub/Item'. Defaults to False.
+            shared (dict[str, str] | None, optional): Tables already published to shared memory by another catalog,
+                by table name and block name. They are attached read-only. Defaults to None.
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.recursive = recursive
+        self.__files: dict[str, Path] = {
+            file.relative_to(self.directory).with_suffix('').as_posix(): file
+            for file in sorted(find_files(self.directory, '*.ies', recursive))
+        }
+        self.__tables: OrderedDict[str, IesTable] = OrderedDict()
+        self.__size: int = 0
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__evictions: int = 0
+        self.__lock = threading.Lock()
+        self.__shared: dict[str, SharedIesTable] = {
+            table: SharedIesTable(name) for table, name in (shared or {}).items()
+        }
+
+    def __reduce__(self):
+        """Pickles the directory, the settings and the names of the shared tables, so a worker
+            process gets a catalog of its own that attaches to the same shared memory
+
+        Returns:
+            tuple: The class and its constructor arguments
+        """
+        shared = {table: shared_table.name for table, shared_table in self.__shared.items()}
+        return (IesCatalog, (self.directory, self.max_bytes, self.recursive, shared))
+
+    def __contains__(self, table: str) -> bool:
+        return table in self.__files
+
+    def __iter__(self):
+        return iter(self.__files)
+
+    def __len__(self) -> int:
+        return len(self.__files)
+
+    def tables(self) -> list[str]:
+        """Gets the names of all tables in the catalog, whether open or not
+
+        Returns:
+            list[str]: The table names
+        """
+        return list(self.__files)
+
+    def __getitem__(self, table: str) -> IesTable | SharedIesTable:
+        """Gets a table, opening it if it is neither shared nor cached
+
+        Args:
+            table (str): The table name, i.e. the file name without .ies
+
+        Raises:
+            KeyError: If the directory has no such table
+            Exception: If the .ies file is corrupt or invalid
+
+        Returns:
+            IesTable | SharedIesTable: The table
+        """
+        with self.__lock:
+            if table in self.__shared:
+                self.__hits += 1
+                return self.__shared[table]
+            if table in self.__tables:
+                self.__hits += 1
+                self.__tables.move_to_end(table)
+                return self.__tables[table]
+            file = self.__files[table]
+            self.__misses += 1
+
+        # Opening is done outside the lock so other tables can be looked up meanwhile
+        opened = IesTable(file)
+        with self.__lock:
+            if table not in self.__tables:
+                self.__tables[table] = opened
+                self.__size += opened.size
+                while self.__size > self.max_bytes and len(self.__tables) > 1:
+                    _, evicted = self.__tables.popitem(last=False)
+                    self.__size -= evicted.size
+                    self.__evictions += 1
+            self.__tables.move_to_end(table)
+            return self.__tables[table]
+
+    def share(self, table: str) -> SharedIesTable:
+        """Decodes a table once into shared memory. From then on this catalog, and every copy of it
+            handed to another process, reads the table from there
+
+        Args:
+            table (str): The table name
+
+        Raises:
+            KeyError: If the directory has no such table
+            Exception: If the .ies file is corrupt or invalid
+
+        Returns:
+            SharedIesTable: The shared table, freed by close
+        """
+        with self.__lock:
+            if table in self.__shared:
+                return self.__shared[table]
+            file = self.__files[table]
+        shared_table = SharedIesTable.publish(file)
+        with self.__lock:
+            if table in self.__shared:
+                # Another thread shared it first
+                shared_table.close()
+            else:
+                self.__shared[table] = shared_table
+                opened = self.__tables.pop(table, None)
+                if opened is not None:
+                    self.__size -= opened.size
+            return self.__shared[table]
+
+    def close(self):
+        """Closes all tables and detaches from the shared ones. Shared tables published by this catalog are freed"""
+        with self.__lock:
+            for shared_table in self.__shared.values():
+                shared_table.close()
+            self.__shared.clear()
+            self.__tables.clear()
+            self.__size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def lookup(self, table: str, class_name: str, default=None) -> dict[str, int | str] | None:
+        """Gets a row of a table by its ClassName
+
+        Args:
+            table (str): The table name
+            class_name (str): The ClassName of the row
+            default (optional): Returned if the table has no such row. Defaults to None.
+
+        Returns:
+            dict[str, int | str] | None: The row values by column name, or default
+        """
+        return self[table].get(class_name, default)
+
+    def clear(self):
+        """Closes all open tables. The statistics are kept"""
+        with self.__lock:
+            self.__tables.clear()
+            self.__size = 0
+
+    def cache_info(self) -> CatalogInfo:
+        """Gets the cache statistics
+
+        Returns:
+            CatalogInfo: Hits, misses and evictions of table lookups, the number of open tables
+                and the memory they use against max_bytes, and the number of shared tables
+        """
+        with self.__lock:
+            return CatalogInfo(
+                self.__hits, self.__misses, self.__evictions, len(self.__tables), self.__size, self.max_bytes,
+                len(self.__shared)
+            )
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+import argparse
+import struct
+from pathlib import Path
+from ies_tools.binarywriter import encode_xor_lp_str
+from ies2xml import (
+    convert_bytestring, get_col_names, read_header, scan_row_offsets
+)
+
+class IesPatcher:
+    """
+        Edits cells of an existing .ies file without decoding or re-encoding the whole table
+        Numeric cells are overwritten in place. When a string changes length, only the rows from
+        the first changed row to the end of the file are rewritten and the sizes in the header are updated
+    """
+
+    __CLASS_ID: str = "ClassID"
+    __CLASS_NAME: str = "ClassName"
+    # Position of data_size and total_size in the header
+    __SIZE_POSITION: int = 136
+
+    def __init__(self, file: Path):
+        """
+        Args:
+            file (Path): The .ies file to patch
+
+        Raises:
+            Exception: If the .ies file is corrupt or invalid
+        """
+        self.file = Path(file)
+        self.__data = self.file.read_bytes()
+        info = read_header(self.file, self.__data, len(self.__data))
+        self.__ncols_int: int = info['ncols_int']
+        self.__ncols_str: int = info['ncols_str']
+        self.__rows_start: int = info['file_size'] - info['offset2']
+        columns_offset = info['file_size'] - info['offset1'] - info['offset2']
+        short_names = get_col_names(self.file, self.__data, info['ncols'], columns_offset, self.__ncols_int)
+        full_names = get_col_names(self.file, self.__data, info['ncols'], columns_offset, self.__ncols_int, full_names=True)
+        # Position of each column within a row - numbers first, then strings - by full property name (CP_Calc).
+        # The short names used in the xml (CP_) work too, unless several columns share one
+        self.__columns: dict[str, int] = {full_names[i]: i for i in range(info['ncols'])}
+        self.__ambiguous: dict[str, list[str]] = {}
+        for i in range(info['ncols']):
+            self.__ambiguous.setdefault(short_names[i], []).append(full_names[i])
+        for short_name, names in list(self.__ambiguous.items()):
+            if len(names) == 1:
+                del self.__ambiguous[short_name]
+                self.__columns.setdefault(short_name, self.__columns[names[0]])
+        self.__row_offsets: list[int] = scan_row_offsets(
+            self.__data, info['nrows'], self.__rows_start, self.__ncols_int, self.__ncols_str
+        )
+        self.__ids: dict[int, int] | None = None
+        self.__names: dict[str, int] | None = None
+        # row index -> column position -> new value
+        self.__edits: dict[int, dict[int, float | str]] = {}
+
+    @property
+    def row_count(self) -> int:
+        """The number of rows in the table"""
+        return len(self.__row_offsets) - 1
+
+    def find_row(self, class_id: int | None = None, class_name: str | None = None) -> int:
+        """Finds a row by its ClassID or ClassName
+
+        Args:
+            class_id (int | None, optional): The ClassID of the row. Defaults to None.
+            class_name (str | None, optional): The ClassName of the row. Defaults to None.
+
+        Raises:
+            KeyError: If no row has the given ClassID or ClassName
+
+        Returns:
+            int: The index of the row
+        """
+        if class_id is not None:
+            if self.__ids is None:
+                self.__ids = {}
+                for index in range(self.row_count):
+                    self.__ids.setdefault(struct.unpack_from('<i', self.__data, self.__row_offsets[index])[0], index)
+            return self.__ids[class_id]
+
+        if self.__names is None:
+            self.__names = {}
+            for index in range(self.row_count):
+                self.__names.setdefault(self.__read_class_name__(index), index)
+        return self.__names[class_name] # type: ignore
+
+    def __read_class_name__(self, row: int) -> str:
+        """Reads the ClassName stored in front of a row
+
+        Args:
+            row (int): The index of the row
+
+        Returns:
+            str: The decoded ClassName
+        """
+        offset = self.__row_offsets[row] + 4
+        length = struct.unpack_from('<H', self.__data, offset)[0]
+        return convert_bytestring(self.__data[offset + 2:offset + 2 + length])
+
+    def __cell_offsets__(self, row: int) -> list[int]:
+        """Finds where each cell of a row starts
+
+        Args:
+            row (int): The index of the row
+
+        Returns:
+            list[int]: The offset of every cell in column position order, followed by the offset of the user scr flags
+        """
+        offset = self.__row_offsets[row] + 4
+        offset += 2 + struct.unpack_from('<H', self.__data, offset)[0]
+        offsets = []
+        for _ in range(self.__ncols_int):
+            offsets.append(offset)
+            offset += 4
+        for _ in range(self.__ncols_str):
+            offsets.append(offset)
+            offset += 2 + struct.unpack_from('<H', self.__data, offset)[0]
+        offsets.append(offset)
+        return offsets
+
+    def get_value(self, row: int, column: str) -> float | str:
+        """Gets the current value of a cell, including edits that have not been saved yet
+
+        Args:
+            row (int): The index of the row
+            column (str): The column name
+
+        Raises:
+            KeyError: If the column does not exist or its short name is shared by several columns
+
+        Returns:
+            float | str: The value of the cell
+        """
+        position = self.__position__(column)
+        if position in self.__edits.get(row, {}):
+            return self.__edits[row][position]
+        offset = self.__cell_offsets__(row)[position]
+        if position < self.__ncols_int:
+            return struct.unpack_from('<f', self.__data, offset)[0]
+        length = struct.unpack_from('<H', self.__data, offset)[0]
+        return convert_bytestring(self.__data[offset + 2:offset + 2 + length])
+
+    def set_value(self, row: int, column: str, value: float | str):
+        """Changes the value of a cell. Nothing is written until save is called
+
+        Args:
+            row (int): The index of the row
+            column (str): The column name
+            value (float | str): The new value; numeric columns must be given a number
+
+        Raises:
+            KeyError: If the column does not exist or its short name is shared by several columns
+            IndexError: If the row does not exist
+        """
+        if not 0 <= row < self.row_count:
+            raise IndexError(f'{self.file} has no row {row}')
+        position = self.__position__(column)
+        self.__edits.setdefault(row, {})[position] = float(value) if position < self.__ncols_int else str(value)
+
+    def __position__(self, column: str) -> int:
+        """Finds the position of a column within a row
+
+        Args:
+            column (str): The full property name, or the short column name if no other column shares it
+
+        Raises:
+            KeyError: If the column does not exist or its short name is shared by several columns
+
+        Returns:
+            int: The position of the column
+        """
+        if column in self.__columns:
+            return self.__columns[column]
+        if column in self.__ambiguous:
+            raise KeyError(f'{column} is the short name of several columns in {self.file} - '
+                           f'use one of {", ".join(self.__ambiguous[column])}')
+        raise KeyError(f'{self.file} has no column {column}')
+
+    def __encode_row__(self, row: int) -> bytes:
+        """Encodes a row with its edits applied. Unchanged cells are copied as raw bytes
+
+        Args:
+            row (int): The index of the row
+
+        Returns:
+            bytes: The encoded row
+        """
+        edits = self.__edits.get(row, {})
+        start = self.__row_offsets[row]
+        offsets = self.__cell_offsets__(row)
+        data = self.__data
+
+        class_id = data[start:start + 4]
+        class_name = data[start + 4:offsets[0]]
+        id_position = self.__columns.get(self.__CLASS_ID)
+        name_position = self.__columns.get(self.__CLASS_NAME)
+        # The ClassID and ClassName stored in front of the row follow their columns
+        if id_position in edits and id_position < self.__ncols_int: # type: ignore
+            class_id = struct.pack('<i', int(edits[id_position])) # type: ignore
+        if name_position in edits and name_position >= self.__ncols_int: # type: ignore
+            class_name = encode_xor_lp_str(str(edits[name_position])) # type: ignore
+
+        parts = [class_id, class_name]
+        for position in range(self.__ncols_int):
+            if position in edits:
+                parts.append(struct.pack('<f', edits[position]))
+            else:
+                parts.append(data[offsets[position]:offsets[position] + 4])
+        for position in range(self.__ncols_int, self.__ncols_int + self.__ncols_str):
+            if position in edits:
+                parts.append(encode_xor_lp_str(str(edits[position])))
+            else:
+                parts.append(data[offsets[position]:offsets[position + 1]])
+        flags = bytearray(data[offsets[-1]:offsets[-1] + self.__ncols_str])
+        for position, value in edits.items():
+            if position >= self.__ncols_int:
+                # Same rule XMLTools uses when loading the xml
+                flags[position - self.__ncols_int] = 1 if "SCR_" in str(value).upper() or "SCP" in str(value).upper() else 0
+        parts.append(bytes(flags))
+        return b''.join(parts)
+
+    def save(self):
+        """Writes all edits to the file
+
+            Rows whose encoded length does not change are overwritten in place. From the first row
+            that changes length onwards, the rest of the file is rewritten and the header sizes are updated
+        """
+        if not self.__edits:
+            return
+
+        encoded = {row: self.__encode_row__(row) for row in sorted(self.__edits)}
+        resized = [row for row, row_bytes in encoded.items()
+                   if len(row_bytes) != self.__row_offsets[row + 1] - self.__row_offsets[row]]
+
+        with self.file.open('r+b') as f:
+            for row, row_bytes in encoded.items():
+                if resized and row >= resized[0]:
+                    break
+                f.seek(self.__row_offsets[row])
+                f.write(row_bytes)
+
+            if resized:
+                first = resized[0]
+                tail = []
+                for row in range(first, self.row_count):
+                    if row in encoded:
+                        tail.append(encoded[row])
+                    else:
+                        tail.append(self.__data[self.__row_offsets[row]:self.__row_offsets[row + 1]])
+                tail_bytes = b''.join(tail)
+                f.seek(self.__row_offsets[first])
+                f.write(tail_bytes)
+                f.truncate()
+                total_size = self.__row_offsets[first] + len(tail_bytes)
+                f.seek(self.__SIZE_POSITION)
+                f.write(struct.pack('<I', total_size - self.__rows_start))
+                f.write(struct.pack('<I', total_size))
+
+        # Start over from the file on disk so offsets and lookups match it again
+        self.__init__(self.file)
+
+
+def build_parser(prog: str | None = None) -> argparse.ArgumentParser:
+    """Builds the command line parser
+
+    Args:
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        prog = prog,
+        description = 'Edits cells of an existing .ies file in place'
+    )
+    row_selector = parser.add_mutually_exclusive_group(required = True)
+    row_selector.add_argument(
+        '--class-id',
+        help = 'The ClassID of the row to edit',
+        type = int
+    )
+    row_selector.add_argument(
+        '--class-name',
+        help = 'The ClassName of the row to edit'
+    )
+    parser.add_argument(
+        '--set', '-s',
+        required = True,
+        action = 'append',
+        metavar = 'COLUMN=VALUE',
+        help = 'A cell to change; can be given several times'
+    )
+    parser.add_argument(
+        'ies_file',
+        help = 'The .ies file to edit',
+        type = Path
+    )
+
+    return parser
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    """Runs the command line interface
+
+    Args:
+        argv (list[str] | None, optional): The arguments without the program name. Defaults to sys.argv[1:].
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+    """
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    patcher = IesPatcher(args.ies_file)
+    try:
+        row = patcher.find_row(args.class_id, args.class_name)
+    except KeyError:
+        parser.error(f'No row with ClassID {args.class_id} in {args.ies_file}' if args.class_id is not None
+                     else f'No row with ClassName {args.class_name} in {args.ies_file}')
+    for assignment in args.set:
+        column, separator, value = assignment.partition('=')
+        if not separator:
+            parser.error(f'Expected COLUMN=VALUE, got {assignment}')
+        try:
+            patcher.set_value(row, column, value)
+        except KeyError as e:
+            parser.error(e.args[0])
+        except ValueError:
+            parser.error(f'{column} is a numeric column, got {value}')
+    patcher.save()
+    print(f'Updated {len(args.set)} cells of {args.ies_file}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+#!/usr/bin/env python
+import argparse
+import getpass
+import json
+import os
+import queue
+import signal
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import BinaryIO
+from ies_tools.schemacache import SchemaCache
+
+# Each message is a little-endian uint32 length, a json header of that length, then `size` bytes of payload
+LENGTH = struct.Struct('<I')
+OPERATIONS = ('to-xml', 'to-ies')
+SOCKET_NAME = 'ies.sock'
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_BATCH_WINDOW_MS = 5
+
+# Set once in each worker process by init_worker
+worker_schema_cache: SchemaCache | None = None
+
+def default_socket() -> Path:
+    """Gets the socket used when none is given, in a directory only the current user can access
+
+        $XDG_RUNTIME_DIR is used when it is set. Otherwise an ies-<user> directory is created in the temp directory
+        with mode 0700, so another local user cannot put a socket there first and receive the requests
+
+    Raises:
+        Exception: If the directory exists but is not a directory owned by and private to the current user
+
+    Returns:
+        Path: The socket
+    """
+    runtime_directory = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_directory:
+        return Path(runtime_directory) / SOCKET_NAME
+
+    directory = Path(tempfile.gettempdir()) / f'ies-{getpass.getuser()}'
+    try:
+        directory.mkdir(mode=0o700)
+    except FileExistsError:
+        pass
+    # lstat, so a symbolic link planted under the name is rejected rather than followed
+    info = directory.lstat()
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise Exception(f'{directory} is not a directory private to {getpass.getuser()} - pass --socket instead')
+    return directory / SOCKET_NAME
+
+def write_message(stream: BinaryIO, header: dict, payload: bytes = b''):
+    """Writes one request or response
+
+    Args:
+        stream (BinaryIO): The socket file
+        header (dict): The json header; its size is set to the length of the payload
+        payload (bytes, optional): The file contents sent inline. Defaults to b''.
+    """
+    header = dict(header, size=len(payload))
+    data = json.dumps(header).encode('utf-8')
+    stream.write(LENGTH.pack(len(data)) + data + payload)
+    stream.flush()
+
+def read_message(stream: BinaryIO) -> tuple[dict, bytes] | None:
+    """Reads one request or response
+
+    Args:
+        stream (BinaryIO): The socket file
+
+    Raises:
+        ConnectionError: If the connection is closed in the middle of a message
+
+    Returns:
+        tuple[dict, bytes] | None: The json header and the payload, None once the other side has finished sending
+    """
+    prefix = stream.read(LENGTH.size)
+    if not prefix:
+        return None
+    if len(prefix) < LENGTH.size:
+        raise ConnectionError('Connection closed in the middle of a message')
+    data = stream.read(LENGTH.unpack(prefix)[0])
+    header = json.loads(data.decode('utf-8'))
+    size = header.pop('size', 0)
+    payload = stream.read(size)
+    if len(payload) < size:
+        raise ConnectionError('Connection closed in the middle of a message')
+    return header, payload
+
+def init_worker(schema_cache: SchemaCache | None):
+    """Runs once in every worker process of the server
+
+    Args:
+        schema_cache (SchemaCache | None): The schema cache used by all conversions of the worker
+    """
+    global worker_schema_cache
+    worker_schema_cache = schema_cache
+
+def run_request(request: dict, payload: bytes) -> tuple[dict, bytes]:
+    """Runs one conversion in a worker process
+
+        A request either names the file on disk ("path", and "output" to write the result to)
+        or carries the file contents as its payload ("name" is used in messages), in which case
+        the result is sent back as the payload of the response
+
+    Args:
+        request (dict): The request header
+        payload (bytes): The inline file contents
+
+    Raises:
+        ValueError: If the request is malformed
+        Exception: If the conversion fails
+
+    Returns:
+        tuple[dict, bytes]: The response header and payload
+    """
+    operation = request.get('op')
+    if operation not in OPERATIONS:
+        raise ValueError(f'Unknown operation {operation} - expected one of {", ".join(OPERATIONS)}')
+    path = request.get('path')
+    if path is None and 'name' not in request:
+        raise ValueError('A request needs either a path or a name and inline contents')
+    if path is not None and not request.get('output'):
+        raise ValueError('A request with a path needs an output path')
+    source = Path(path) if path is not None else Path(request['name'])
+
+    if operation == 'to-xml':
+        # Imported here so the server starts without them, workers import them once
+        from ies2xml import decode_file, xml_bytes
+        header, tsv = decode_file(source, 1, worker_schema_cache, None if path is not None else payload)
+        result = xml_bytes(tsv, header)
+    else:
+        from xmltools import XMLTools
+        xml_tool = XMLTools(worker_schema_cache)
+        xml_tool.load_xml(source if path is not None else payload, source.name)
+        result = xml_tool.to_bytes()
+        if result is None:
+            raise ValueError(f'{source.name} could not be converted - it has no idspace')
+
+    if path is None:
+        return {'ok': True}, result
+    output = Path(request['output'])
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(result)
+    return {'ok': True, 'output': str(output)}, b''
+
+def run_batch(batch: list[tuple[dict, bytes]]) -> list[tuple[dict, bytes]]:
+    """Runs a batch of requests in a worker process. A failing request does not affect the others
+
+    Args:
+        batch (list[tuple[dict, bytes]]): The request headers and payloads
+
+    Returns:
+        list[tuple[dict, bytes]]: A response for every request, in the same order
+    """
+    responses = []
+    for request, payload in batch:
+        try:
+            responses.append(run_request(request, payload))
+        except Exception as e:
+            responses.append((error_response(e), b''))
+    return responses
+
+def error_response(error: BaseException) -> dict:
+    """Builds the response header of a failed request
+
+    Args:
+        error (BaseException): The reason
+
+    Returns:
+        dict: The header, with the exception type and message
+    """
+    return {'ok': False, 'error': str(error), 'type': type(error).__name__}
+
+
+class RequestBatcher:
+    """
+        Collects requests from all connections and hands them to the worker pool in batches.
+        While every worker is busy, new requests wait and go out together as the next batch
+    """
+
+    def __init__(self, jobs: int, batch_size: int, batch_window: float, schema_cache: SchemaCache | None = None):
+        """
+        Args:
+            jobs (int): Number of worker processes, each kept running for the life of the server
+            batch_size (int): The most requests sent to a worker at once
+            batch_window (float): Seconds to wait for more requests before sending a batch that is not full
+            schema_cache (SchemaCache | None, optional): The schema cache used by the workers. Defaults to None.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.requests: int = 0
+        self.batches: int = 0
+        self.errors: int = 0
+        self.__pool = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(schema_cache,))
+        # One batch per worker in flight, the rest keep queueing
+        self.__free_workers = threading.Semaphore(jobs)
+        self.__queue: queue.Queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__thread = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread.start()
+
+    def submit(self, request: dict, payload: bytes) -> Future:
+        """Queues a request
+
+        Args:
+            request (dict): The request header
+            payload (bytes): The inline file contents
+
+        Returns:
+            Future: Resolves to the response header and payload
+        """
+        future: Future = Future()
+        self.__queue.put((request, payload, future))
+        return future
+
+    def stats(self) -> dict:
+        """Gets the number of requests, batches and failed requests so far
+
+        Returns:
+            dict: The counters
+        """
+        with self.__lock:
+            return {'requests': self.requests, 'batches': self.batches, 'errors': self.errors}
+
+    def close(self):
+        """Stops taking requests and shuts the worker pool down once the queued requests are done"""
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__pool.shutdown()
+
+    def __run__(self):
+        """Takes requests off the queue and sends them to the pool in batches"""
+        running = True
+        while running:
+            item = self.__queue.get()
+            if item is None:
+                break
+            self.__free_workers.acquire()
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    # Everything that queued up while waiting for a worker is taken without waiting
+                    item = self.__queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+
+            try:
+                future = self.__pool.submit(run_batch, [(request, payload) for request, payload, _ in batch])
+            except Exception as e:
+                self.__free_workers.release()
+                self.__resolve__(batch, None, e)
+                continue
+            future.add_done_callback(lambda done, batch=batch: self.__resolve__(batch, done, None))
+
+    def __resolve__(self, batch: list, done: Future | None, error: BaseException | None):
+        """Hands the responses of a finished batch to the waiting connections
+
+        Args:
+            batch (list): The requests of the batch with their futures
+            done (Future | None): The finished pool task
+            error (BaseException | None): Why the batch could not be submitted
+        """
+        if done is not None:
+            self.__free_workers.release()
+            error = done.exception()
+        if error is not None:
+            # The worker itself failed, e.g. it was killed, so every request of the batch fails
+            responses = [(error_response(error), b'')] * len(batch)
+        else:
+            responses = done.result() # type: ignore
+        with self.__lock:
+            self.requests += len(batch)
+            self.batches += 1
+            self.errors += sum(not header['ok'] for header, _ in responses)
+        for (_, _, future), response in zip(batch, responses):
+            future.set_result(response)
+
+
+def serve(socket_path: Path, jobs: int, batch_size: int = DEFAULT_BATCH_SIZE,
+          batch_window: float = DEFAULT_BATCH_WINDOW_MS / 1000, schema_cache: SchemaCache | None = None):
+    """Runs the conversion server until it is interrupted
+
+    Args:
+        socket_path (Path): The unix domain socket to listen on
+        jobs (int): Number of worker processes
+        batch_size (int, optional): The most requests sent to a worker at once. Defaults to 32.
+        batch_window (float, optional): Seconds to wait for more requests before sending a batch. Defaults to 0.005.
+        schema_cache (SchemaCache | None, optional): The schema cache used by the workers. Defaults to None.
+
+    Raises:
+        Exception: If another server is already listening on the socket or something else is in its place
+    """
+    import socketserver
+
+    try:
+        mode = socket_path.lstat().st_mode
+    except FileNotFoundError:
+        mode = None
+    if mode is not None:
+        if not stat.S_ISSOCK(mode):
+            raise Exception(f'{socket_path} exists and is not a socket')
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(str(socket_path))
+            raise Exception(f'A server is already listening on {socket_path}')
+        except ConnectionRefusedError:
+            # Left behind by a server that did not shut down cleanly
+            socket_path.unlink()
+
+    batcher = RequestBatcher(jobs, batch_size, batch_window, schema_cache)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            # Requests are read and queued as they arrive; responses are written in the same order
+            # by a second thread, so a client may send many requests before reading any response
+            responses: queue.Queue = queue.Queue()
+            writer = threading.Thread(target=self.__write_responses__, args=(responses,))
+            writer.start()
+            try:
+                while True:
+                    message = read_message(self.rfile)
+                    if message is None:
+                        break
+                    request, payload = message
+                    if request.get('op') == 'ping':
+                        future: Future = Future()
+                        future.set_result(({'ok': True, **batcher.stats()}, b''))
+                        responses.put(future)
+                    else:
+                        responses.put(batcher.submit(request, payload))
+            except (ConnectionError, ValueError) as e:
+                future = Future()
+                future.set_result((error_response(e), b''))
+                responses.put(future)
+            finally:
+                responses.put(None)
+                writer.join()
+
+        def __write_responses__(self, responses: queue.Queue):
+            for future in iter(responses.get, None):
+                header, payload = future.result()
+                try:
+                    write_message(self.wfile, header, payload)
+                except OSError:
+                    # The client went away; the remaining responses are dropped
+                    pass
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+    with Server(str(socket_path), Handler) as server:
+        # shutdown waits for serve_forever to return, so it cannot be called on the thread running it
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        print(f'Listening on {socket_path} with {jobs} workers', flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_path.unlink(missing_ok=True)
+            batcher.close()
+            print(f'Stopped - {batcher.stats()}', flush=True)
+
+def send_requests(socket_path: Path, requests: list[tuple[dict, bytes]]) -> list[tuple[dict, bytes]]:
+    """Sends requests to a running server over one connection and waits for all responses
+
+    Args:
+        socket_path (Path): The unix domain socket of the server
+        requests (list[tuple[dict, bytes]]): The request headers and inline payloads
+
+    Raises:
+        ConnectionError: If the server closes the connection early
+
+    Returns:
+        list[tuple[dict, bytes]]: The responses in the order of the requests
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        with client.makefile('wb') as stream:
+            for request, payload in requests:
+                write_message(stream, request, payload)
+        client.shutdown(socket.SHUT_WR)
+        responses = []
+        with client.makefile('rb') as stream:
+            for _ in requests:
+                response = read_message(stream)
+                if response is None:
+                    raise ConnectionError(f'{socket_path} closed the connection before answering every request')
+                responses.append(response)
+    return responses
+
+def build_parser(prog: str | None = None) -> argparse.ArgumentParser:
+    """Builds the command line parser
+
+    Args:
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        prog = prog,
+        description = 'A local conversion server that keeps its worker processes warm, and its client'
+    )
+    subparser = parser.add_subparsers(
+        help = 'subcommand help',
+        required = True,
+        dest = 'subcommand'
+    )
+
+    parser_serve = subparser.add_parser('serve', help = 'Run the server until interrupted')
+    parser_serve.add_argument(
+        '--socket', '-s',
+        help = 'The unix domain socket to listen on. Defaults to ies.sock in $XDG_RUNTIME_DIR, '
+               'or in a private ies-<user> directory in the temp directory',
+        type = Path
+    )
+    parser_serve.add_argument(
+        '--jobs', '-p',
+        default = os.cpu_count() or 1,
+        help = 'Number of worker processes. Defaults to the number of CPUs',
+        type = int
+    )
+    parser_serve.add_argument(
+        '--batch-size',
+        default = DEFAULT_BATCH_SIZE,
+        help = 'The most requests handed to a worker at once',
+        type = int
+    )
+    parser_serve.add_argument(
+        '--batch-window',
+        default = DEFAULT_BATCH_WINDOW_MS,
+        help = 'Milliseconds to wait for more requests before handing over a batch that is not full',
+        type = float
+    )
+    parser_serve.add_argument(
+        '--schema-cache',
+        required = False,
+        help = 'Optional directory of recorded column schemas per id space',
+        type = Path
+    )
+
+    parser_client = subparser.add_parser('client', help = 'Send conversions to a running server')
+    parser_client.add_argument(
+        '--socket', '-s',
+        help = 'The unix domain socket of the server. Defaults to ies.sock in $XDG_RUNTIME_DIR, '
+               'or in a private ies-<user> directory in the temp directory',
+        type = Path
+    )
+    parser_client.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'Optional output directory. Defaults to xml_files for to-xml and ies_out for to-ies',
+        type = Path
+    )
+    parser_client.add_argument(
+        '--name',
+        default = 'stdin',
+        help = 'The file name used in messages when the file is read from stdin'
+    )
+    parser_client.add_argument(
+        'operation',
+        choices = [*OPERATIONS, 'ping'],
+        help = 'The conversion, or ping to get the server statistics'
+    )
+    parser_client.add_argument(
+        'files',
+        nargs = '*',
+        help = 'The files to convert; - reads one file from stdin and writes the result to stdout',
+        type = Path
+    )
+
+    return parser
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    """Runs the command line interface
+
+    Args:
+        argv (list[str] | None, optional): The arguments without the program name. Defaults to sys.argv[1:].
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+    """
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    if not hasattr(socket, 'AF_UNIX'):
+        parser.error('Unix domain sockets are not available on this platform')
+    if args.socket is None:
+        try:
+            args.socket = default_socket()
+        except Exception as e:
+            parser.error(str(e))
+
+    if args.subcommand == 'serve':
+        schema_cache = SchemaCache(args.schema_cache) if args.schema_cache is not None else None
+        serve(args.socket, max(1, args.jobs), max(1, args.batch_size), args.batch_window / 1000, schema_cache)
+        return
+
+    if args.operation == 'ping':
+        print(json.dumps(send_requests(args.socket, [({'op': 'ping'}, b'')])[0][0]))
+        return
+
+    if len(args.files) == 0:
+        parser.error('No files to convert')
+    if len(args.files) > 1 and any(str(file) == '-' for file in args.files):
+        parser.error('- can only be given on its own')
+    suffix = '.xml' if args.operation == 'to-xml' else '.ies'
+    default_output = 'xml_files' if args.operation == 'to-xml' else 'ies_out'
+    output = (args.output if args.output is not None else Path(os.getcwd(), default_output)).resolve()
+
+    requests = []
+    for file in args.files:
+        if str(file) == '-':
+            requests.append(({'op': args.operation, 'name': args.name}, sys.stdin.buffer.read()))
+        else:
+            requests.append((
+                {'op': args.operation, 'path': str(file.resolve()), 'output': str(output / f'{file.stem}{suffix}')}, b''
+            ))
+
+    failed = 0
+    for (request, _), (response, payload) in zip(requests, send_requests(args.socket, requests)):
+        source = request.get('path', request.get('name'))
+        if not response['ok']:
+            failed += 1
+            print(f'Error converting {source}: {response["type"]}: {response["error"]}', file=sys.stderr)
+        elif 'output' in response:
+            print(f'Converted {source} to {response["output"]}')
+        else:
+            sys.stdout.buffer.write(payload)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
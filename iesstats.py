@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Iterator
+from ies_tools.discovery import find_files
+from ies2xml import get_col_names, get_rows, read_header
+
+STATS_SUFFIX = '.stats.json'
+# Rows per block; numeric min/max are also kept per block so row ranges can be skipped
+STATS_BLOCK_ROWS = 4096
+# String columns with at most this many distinct values list all of them
+STATS_MAX_VALUES = 16
+OPERATORS = ('==', '!=', '<=', '>=', '<', '>')
+CONDITION_PATTERN = re.compile(r'^\s*(.+?)\s*(==|!=|<=|>=|<|>)\s*(.*?)\s*$')
+
+def stats_path(file: Path) -> Path:
+    """Gets the path of the statistics file kept next to an .ies file
+
+    Args:
+        file (Path): The .ies file
+
+    Returns:
+        Path: <name>.stats.json in the same directory
+    """
+    return file.with_name(file.stem + STATS_SUFFIX)
+
+def compute_stats(file: Path, block_rows: int = STATS_BLOCK_ROWS) -> dict:
+    """Computes the column statistics of an .ies file
+
+        Numeric columns get their min and max, for the whole table and for every block of rows.
+        String columns get their min, max and number of distinct values, plus the first distinct
+        values as samples - all of them when there are few enough
+
+    Args:
+        file (Path): The .ies file
+        block_rows (int, optional): The number of rows per block. Defaults to STATS_BLOCK_ROWS.
+
+    Raises:
+        Exception: If the .ies file is corrupt or invalid
+
+    Returns:
+        dict: The statistics, ready to be written as json
+    """
+    file = Path(file)
+    data = file.read_bytes()
+    info = read_header(file, data, len(data))
+    ncols_int = info['ncols_int']
+    col_names = get_col_names(file, data, info['ncols'], info['file_size'] - info['offset1'] - info['offset2'], ncols_int)
+    columns = [str(col_names[i]) for i in range(info['ncols'])]
+    rows = get_rows(file, data, [], info['nrows'], info['file_size'] - info['offset2'], ncols_int, info['ncols_str'])
+
+    column_stats = {}
+    for position, column in enumerate(columns):
+        values = [row[position] for row in rows]
+        if position < ncols_int:
+            column_stats[column] = {
+                'type': 'number',
+                'min': min(values, default=None),
+                'max': max(values, default=None),
+            }
+            continue
+        distinct = list(dict.fromkeys(values))
+        column_stats[column] = {
+            'type': 'string',
+            'min': min(distinct, default=None),
+            'max': max(distinct, default=None),
+            'distinct': len(distinct),
+            'samples': distinct[:STATS_MAX_VALUES],
+            'complete': len(distinct) <= STATS_MAX_VALUES,
+        }
+
+    blocks = []
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        blocks.append({
+            'start': start,
+            'end': start + len(block),
+            'columns': {
+                columns[position]: [min(row[position] for row in block), max(row[position] for row in block)]
+                for position in range(ncols_int)
+            },
+        })
+
+    stat = file.stat()
+    return {
+        'file': file.name,
+        # Statistics of a file that has changed since are ignored
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'idspace': info['idspace'],
+        'rows': len(rows),
+        'columns': column_stats,
+        'blocks': blocks,
+    }
+
+def write_stats(file: Path, dest: Path | None = None) -> Path:
+    """Computes the column statistics of an .ies file and writes them as compact json
+
+    Args:
+        file (Path): The .ies file
+        dest (Path | None, optional): The statistics file. Defaults to <name>.stats.json next to the .ies file.
+
+    Raises:
+        Exception: If the .ies file is corrupt or invalid
+
+    Returns:
+        Path: The statistics file
+    """
+    file = Path(file)
+    dest = stats_path(file) if dest is None else Path(dest)
+    dest.write_text(json.dumps(compute_stats(file), ensure_ascii=False, separators=(',', ':')), encoding='utf-8')
+    return dest
+
+def load_stats(file: Path) -> dict | None:
+    """Loads the statistics of an .ies file if they are still up to date
+
+    Args:
+        file (Path): The .ies file
+
+    Returns:
+        dict | None: The statistics, None if there are none or the file changed after they were written
+    """
+    path = stats_path(Path(file))
+    if not path.is_file():
+        return None
+    try:
+        stats = json.loads(path.read_text(encoding='utf-8'))
+    except ValueError:
+        return None
+    stat = Path(file).stat()
+    if stats.get('size') != stat.st_size or stats.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    return stats
+
+def parse_condition(text: str) -> tuple[str, str, str]:
+    """Parses a condition such as "Level>=50" or "ClassName==Item_3"
+
+    Args:
+        text (str): The condition
+
+    Raises:
+        ValueError: If the text is not COLUMN OPERATOR VALUE
+
+    Returns:
+        tuple[str, str, str]: The column, the operator and the value
+    """
+    match = CONDITION_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f'Expected COLUMN OPERATOR VALUE with one of {" ".join(OPERATORS)}, got {text}')
+    return match.group(1), match.group(2), match.group(3)
+
+def compare(left, operator: str, right) -> bool:
+    """Applies an operator
+
+    Args:
+        left: The row value
+        operator (str): One of OPERATORS
+        right: The value of the condition
+
+    Returns:
+        bool: The result
+    """
+    if operator == '==':
+        return left == right
+    if operator == '!=':
+        return left != right
+    if operator == '<':
+        return left < right
+    if operator == '<=':
+        return left <= right
+    if operator == '>':
+        return left > right
+    return left >= right
+
+def range_may_match(low, high, operator: str, value) -> bool:
+    """Checks whether any value between low and high could satisfy a condition
+
+    Args:
+        low: The smallest value
+        high: The largest value
+        operator (str): One of OPERATORS
+        value: The value of the condition
+
+    Returns:
+        bool: False only if no value in the range can match
+    """
+    if low is None:
+        # No rows at all
+        return False
+    if operator == '==':
+        return low <= value <= high
+    if operator == '!=':
+        return not (low == high == value)
+    if operator in ('<', '<='):
+        return compare(low, operator, value)
+    return compare(high, operator, value)
+
+def typed_value(numeric: bool, value):
+    """Converts the value of a condition to the type of the column
+
+    Args:
+        numeric (bool): Whether the column is numeric
+        value: The value of the condition
+
+    Raises:
+        ValueError: If a numeric column is compared with something that is not a number
+
+    Returns:
+        float | str: The value
+    """
+    return float(value) if numeric else str(value)
+
+def row_matches(row: dict[str, int | str], conditions: list[tuple[str, str, object]]) -> bool:
+    """Checks a row against all conditions
+
+    Args:
+        row (dict[str, int | str]): The row values by column name
+        conditions (list[tuple[str, str, object]]): The conditions
+
+    Returns:
+        bool: True if the row has every column and satisfies every condition
+    """
+    for column, operator, value in conditions:
+        if column not in row:
+            return False
+        try:
+            value = typed_value(not isinstance(row[column], str), value)
+        except ValueError:
+            # A number column never equals text
+            return False
+        if not compare(row[column], operator, value):
+            return False
+    return True
+
+def table_may_match(stats: dict, conditions: list[tuple[str, str, object]]) -> bool:
+    """Checks the table statistics against all conditions
+
+    Args:
+        stats (dict): The statistics of the table
+        conditions (list[tuple[str, str, object]]): The conditions
+
+    Returns:
+        bool: False only if no row of the table can match
+    """
+    for column, operator, value in conditions:
+        column_stats = stats['columns'].get(column)
+        if column_stats is None:
+            return False
+        try:
+            value = typed_value(column_stats['type'] == 'number', value)
+        except ValueError:
+            return False
+        if not range_may_match(column_stats['min'], column_stats['max'], operator, value):
+            return False
+        if column_stats['type'] == 'string' and column_stats['complete']:
+            if not any(compare(sample, operator, value) for sample in column_stats['samples']):
+                return False
+    return True
+
+
+class TableScanner:
+    """
+        Finds the rows matching all conditions across the .ies tables of a directory.
+        The statistics written by write_stats are consulted first, so tables and blocks
+        of rows that cannot match are never read. Tables without up to date statistics
+        are read completely
+    """
+
+    def __init__(self, directory: Path, recursive: bool = False):
+        """
+        Args:
+            directory (Path): The directory containing the .ies files, or a single .ies file
+            recursive (bool, optional): Include .ies files in sub directories. Defaults to False.
+        """
+        self.directory = Path(directory)
+        if self.directory.is_file():
+            self.__files = [self.directory]
+        else:
+            self.__files = sorted(find_files(self.directory, '*.ies', recursive))
+        self.tables: int = 0
+        self.tables_skipped: int = 0
+        self.blocks: int = 0
+        self.blocks_skipped: int = 0
+        self.rows_read: int = 0
+
+    def scan(self, conditions: list[tuple[str, str, object]] | list[str]) -> Iterator[tuple[Path, dict[str, int | str]]]:
+        """Yields every row matching all conditions
+
+        Args:
+            conditions (list[tuple[str, str, object]] | list[str]): (column, operator, value) tuples or
+                strings such as "Level>=50"; the operator is one of == != < <= > >=
+
+        Raises:
+            ValueError: If a condition is malformed
+
+        Yields:
+            tuple[Path, dict[str, int | str]]: The .ies file and the row values by column name
+        """
+        # Imported here so the statistics can be used without the catalog
+        from iescatalog import IesTable
+
+        parsed = [parse_condition(condition) if isinstance(condition, str) else condition for condition in conditions]
+        for operator in (condition[1] for condition in parsed):
+            if operator not in OPERATORS:
+                raise ValueError(f'Unknown operator {operator} - expected one of {" ".join(OPERATORS)}')
+
+        for file in self.__files:
+            self.tables += 1
+            stats = load_stats(file)
+            if stats is None:
+                table = IesTable(file)
+                ranges = [(0, len(table))]
+            else:
+                if not table_may_match(stats, parsed):
+                    self.tables_skipped += 1
+                    continue
+                ranges = self.__block_ranges__(stats, parsed)
+                if not ranges:
+                    self.tables_skipped += 1
+                    continue
+                table = IesTable(file)
+
+            for start, end in ranges:
+                for index in range(start, end):
+                    row = table.row(index)
+                    self.rows_read += 1
+                    if row_matches(row, parsed):
+                        yield file, row
+
+    def __block_ranges__(self, stats: dict, conditions: list[tuple[str, str, object]]) -> list[tuple[int, int]]:
+        """Finds the row ranges whose numeric min/max do not rule out every condition
+
+        Args:
+            stats (dict): The statistics of the table
+            conditions (list[tuple[str, str, object]]): The conditions, already checked against the table statistics
+
+        Returns:
+            list[tuple[int, int]]: The start and end of the row ranges to read, neighbouring blocks merged
+        """
+        ranges: list[tuple[int, int]] = []
+        for block in stats['blocks']:
+            self.blocks += 1
+            may_match = True
+            for column, operator, value in conditions:
+                bounds = block['columns'].get(column)
+                if bounds is not None and not range_may_match(bounds[0], bounds[1], operator, float(value)): # type: ignore
+                    may_match = False
+                    break
+            if not may_match:
+                self.blocks_skipped += 1
+            elif ranges and ranges[-1][1] == block['start']:
+                ranges[-1] = (ranges[-1][0], block['end'])
+            else:
+                ranges.append((block['start'], block['end']))
+        return ranges
+
+
+def build_parser(prog: str | None = None) -> argparse.ArgumentParser:
+    """Builds the command line parser
+
+    Args:
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        prog = prog,
+        description = 'Column statistics of .ies files and scans that skip what cannot match'
+    )
+    subparser = parser.add_subparsers(
+        help = 'subcommand help',
+        required = True,
+        dest = 'subcommand'
+    )
+
+    parser_build = subparser.add_parser('build', help = 'Write <name>.stats.json next to each .ies file')
+    parser_build.add_argument(
+        '--recursive', '-r',
+        action = 'store_true',
+        help = 'Also include .ies files in sub directories'
+    )
+    parser_build.add_argument(
+        'path',
+        help = 'An .ies file or a directory of .ies files',
+        type = Path
+    )
+
+    parser_scan = subparser.add_parser('scan', help = 'Print the rows matching all conditions as json lines')
+    parser_scan.add_argument(
+        '--where', '-w',
+        required = True,
+        action = 'append',
+        metavar = 'CONDITION',
+        help = 'A condition such as "Level>=50" or "ClassName==Item_3"; can be given several times'
+    )
+    parser_scan.add_argument(
+        '--recursive', '-r',
+        action = 'store_true',
+        help = 'Also include .ies files in sub directories'
+    )
+    parser_scan.add_argument(
+        'path',
+        help = 'An .ies file or a directory of .ies files',
+        type = Path
+    )
+
+    return parser
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    """Runs the command line interface
+
+    Args:
+        argv (list[str] | None, optional): The arguments without the program name. Defaults to sys.argv[1:].
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+    """
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    if args.subcommand == 'build':
+        files = [args.path] if args.path.is_file() else find_files(args.path, '*.ies', args.recursive)
+        for file in files:
+            try:
+                print(f'Wrote {write_stats(file)}')
+            except Exception as e:
+                print(f'Error writing the statistics of {file}: {e}')
+        return
+
+    try:
+        conditions = [parse_condition(condition) for condition in args.where]
+    except ValueError as e:
+        parser.error(str(e))
+    scanner = TableScanner(args.path, args.recursive)
+    try:
+        for file, row in scanner.scan(conditions):
+            print(json.dumps({'file': str(file), **row}, ensure_ascii=False))
+    except ValueError as e:
+        parser.error(str(e))
+    print(
+        f'{scanner.tables_skipped} of {scanner.tables} tables and {scanner.blocks_skipped} of {scanner.blocks} '
+        f'blocks skipped, {scanner.rows_read} rows read',
+        file = sys.stderr
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+import argparse
+import importlib
+import importlib.util
+import os
+import struct
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+from ies_tools.discovery import find_files, mirror_path
+from ies_tools.iescolumn import IesColumn
+from ies_tools.iesheader import IesHeader
+from ies_tools.iesrow import IesRow
+from ies2xml import COLUMN_SIZE, convert_bytestring, get_col_schema, read_header
+
+CLASS_ID = "ClassID"
+CLASS_NAME = "ClassName"
+
+RowTransform = Callable[[IesRow], IesRow | None]
+
+def read_table(file: Path) -> tuple[IesHeader, list[IesColumn], Iterator[IesRow]]:
+    """Opens an .ies file for transforming. The rows are decoded one at a time as they are iterated
+
+        Numeric values keep their float value, unlike the xml written by ies2xml which stores them as integers
+
+    Args:
+        file (Path): The .ies file
+
+    Raises:
+        Exception: If the .ies file is corrupt or invalid
+
+    Returns:
+        tuple[IesHeader, list[IesColumn], Iterator[IesRow]]: The header, the columns in file order and the rows
+    """
+    data = file.read_bytes()
+    info = read_header(file, data, len(data))
+    ncols_int = info['ncols_int']
+
+    header = IesHeader()
+    header.id_space = info['idspace']
+    key_space = data[64:128].split(b'\x00', 1)[0].decode('utf-8', errors='replace')
+    header.key_space = key_space if key_space else None
+    header.use_class_id = data[144] == 1
+    columns_offset = info['file_size'] - info['offset1'] - info['offset2']
+    columns = get_col_schema(data, info['ncols'], columns_offset)
+    for i, column in enumerate(columns):
+        # The xml only keeps the short column name; the full property name (e.g. CP_Calc for CP_) follows it
+        offset = columns_offset + i * COLUMN_SIZE + 64
+        column.name = convert_bytestring(data[offset:offset + 64])
+    # Values are stored numbers first, then strings, each in declaration order
+    sorted_columns = sorted(columns, key=lambda column: (0 if column.isNumber() else 1, column.declaration_index))
+    if sum(column.isNumber() for column in columns) != ncols_int:
+        raise Exception(f'IES file {file} is invalid: column types do not match {ncols_int} numeric columns')
+
+    def rows() -> Iterator[IesRow]:
+        offset = info['file_size'] - info['offset2']
+        for _ in range(info['nrows']):
+            row = IesRow()
+            row.class_id = struct.unpack_from('<i', data, offset)[0]
+            length = struct.unpack_from('<H', data, offset + 4)[0]
+            row.class_name = convert_bytestring(data[offset + 6:offset + 6 + length])
+            offset += 6 + length
+            for column in sorted_columns[:ncols_int]:
+                row[column.name] = struct.unpack_from('<f', data, offset)[0]
+                offset += 4
+            for column in sorted_columns[ncols_int:]:
+                length = struct.unpack_from('<H', data, offset)[0]
+                row[column.name] = convert_bytestring(data[offset + 2:offset + 2 + length])
+                offset += 2 + length
+            for column in sorted_columns[ncols_int:]:
+                row.user_scr_dict[column.name] = data[offset] == 1
+                offset += 1
+            yield row
+
+    return header, columns, rows()
+
+def apply_transforms(rows: Iterable[IesRow], columns: list[IesColumn], transforms: list[RowTransform]) -> Iterator[IesRow]:
+    """Passes each row through the transforms in order
+
+        A transform gets the row, changes it in place or returns a new one, and returns None to drop the row.
+        ClassID and ClassName in front of the row follow their columns, and the SCR flag of every changed string
+        is set again with the rule XMLTools uses when loading xml
+
+    Args:
+        rows (Iterable[IesRow]): The rows to transform
+        columns (list[IesColumn]): The columns of the table
+        transforms (list[RowTransform]): The callables to apply
+
+    Returns:
+        Iterator[IesRow]: The rows that were not dropped
+    """
+    string_columns = [column.name for column in columns if not column.isNumber()]
+    for row in rows:
+        original = dict(row)
+        result: IesRow | None = row
+        for transform in transforms:
+            result = transform(result) # type: ignore
+            if result is None:
+                break
+        if result is None:
+            continue
+
+        if CLASS_ID in result:
+            result.class_id = int(result[CLASS_ID]) # type: ignore
+        if CLASS_NAME in result:
+            result.class_name = str(result[CLASS_NAME])
+        for name in string_columns:
+            value = result.get(name)
+            if value != original.get(name):
+                value = "" if value is None else str(value)
+                result.user_scr_dict[name] = "SCR_" in value.upper() or "SCP" in value.upper()
+        yield result
+
+def transform_file(file: Path, transforms: list[RowTransform], dest: Path | None = None) -> int:
+    """Decodes an .ies file, passes its rows through the transforms and encodes it again without going through xml
+
+        Rows are streamed from the reader through the transforms to the writer, so only the encoded bytes are held
+
+    Args:
+        file (Path): The .ies file to transform
+        transforms (list[RowTransform]): The callables applied to each row in order
+        dest (Path | None, optional): The file to write. Defaults to "ies_out/<name>.ies" in the current directory.
+
+    Raises:
+        Exception: If the .ies file is corrupt or the result does not fit in one .ies file
+
+    Returns:
+        int: The number of rows written
+    """
+    # Imported here since xmltools pulls in the xml libraries
+    from xmltools import XMLTools
+
+    file = Path(file)
+    if dest is None:
+        dest = Path(os.path.realpath(os.path.join(os.getcwd(), "ies_out"))) / file.name
+    header, columns, rows = read_table(file)
+    tool = XMLTools()
+    tool.header = header
+    tool.columns = columns
+    tool.file_name = file.name
+
+    written = 0
+    def count(rows: Iterable[IesRow]) -> Iterator[IesRow]:
+        nonlocal written
+        for row in rows:
+            written += 1
+            yield row
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the destination first, so a failing transform does not leave half a file
+    partial = dest.with_name(dest.name + '.partial')
+    try:
+        with partial.open('wb') as writer:
+            tool.write_ies(writer, rows=count(apply_transforms(rows, columns, transforms)))
+        partial.replace(dest)
+    finally:
+        partial.unlink(missing_ok=True)
+    return written
+
+def load_transform(spec: str) -> RowTransform:
+    """Loads a transform from "path/to/script.py:function" or "package.module:function"
+
+    Args:
+        spec (str): Where to find the callable
+
+    Raises:
+        ValueError: If the spec has no function name
+
+    Returns:
+        RowTransform: The callable
+    """
+    location, separator, name = spec.rpartition(':')
+    if not separator or not location or not name:
+        raise ValueError(f'Expected SCRIPT.py:FUNCTION or MODULE:FUNCTION, got {spec}')
+    if location.endswith('.py'):
+        module_spec = importlib.util.spec_from_file_location(Path(location).stem, location)
+        if module_spec is None or module_spec.loader is None:
+            raise ValueError(f'Cannot load {location}')
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(location)
+    return getattr(module, name)
+
+def build_parser(prog: str | None = None) -> argparse.ArgumentParser:
+    """Builds the command line parser
+
+    Args:
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        prog = prog,
+        description = 'Transforms the rows of .ies files with python functions without converting to xml'
+    )
+    parser.add_argument(
+        '--transform', '-t',
+        required = True,
+        action = 'append',
+        metavar = 'SCRIPT.py:FUNCTION',
+        help = 'A function that takes a row and returns it, changed or not, or None to drop it; '
+               'MODULE:FUNCTION works as well. Can be given several times and is applied in order'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'Optional output directory; mirrors the input directory tree. Defaults to ies_out',
+        type = Path
+    )
+    parser.add_argument(
+        '--recursive', '-r',
+        action = 'store_true',
+        help = 'Also transform .ies files in sub directories'
+    )
+    parser.add_argument(
+        'path',
+        help = 'An .ies file or a directory of .ies files',
+        type = Path
+    )
+
+    return parser
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    """Runs the command line interface
+
+    Args:
+        argv (list[str] | None, optional): The arguments without the program name. Defaults to sys.argv[1:].
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+    """
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    try:
+        transforms = [load_transform(spec) for spec in args.transform]
+    except (ValueError, ImportError, AttributeError, OSError) as e:
+        parser.error(str(e))
+
+    output = Path(os.path.realpath(os.path.join(os.getcwd(), "ies_out"))) if args.output is None else args.output
+    if args.path.is_dir():
+        files = find_files(args.path, '*.ies', args.recursive)
+        destinations = [mirror_path(file, args.path, output, '.ies') for file in files]
+    else:
+        files = [args.path]
+        destinations = [output / args.path.name]
+
+    for file, dest in zip(files, destinations):
+        try:
+            rows = transform_file(file, transforms, dest)
+            print(f'Transformed {file} to {dest} - {rows} rows')
+        except Exception as e:
+            print(f'Error transforming {file}: {e}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Scans that consult the statistics must find exactly the rows a full scan finds.
+
+    $ python -m pytest tests
+"""
+import json
+import operator
+import os
+import pytest
+from pathlib import Path
+from ies2xml import xml_bytes
+from ies_tools.xmlbackend import get_backend
+from iescatalog import IesTable
+from iesstats import TableScanner, compute_stats, load_stats, stats_path
+from xmltools import XMLTools
+
+# Small blocks so a 40 row table has several of them
+BLOCK_ROWS = 8
+ITEM = [['ClassID', 'ClassName', 'Name', 'Level', 'Grade']] + [
+    [i, f'Item_{i}', f'Name_{i:02}', i * 10, 'ABC'[i % 3]] for i in range(1, 41)
+]
+SKILL = [['ClassID', 'ClassName', 'Name', 'Level', 'Cooldown']] + [
+    [i, f'Skill_{i}', f'Skill_{i:02}', 1000 + i, i * 5] for i in range(1, 7)
+]
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+def write_table(directory: Path, name: str, tsv: list[list]) -> Path:
+    tool = XMLTools()
+    tool.load_xml(xml_bytes(tsv, name, get_backend('stdlib')), f'{name}.xml')
+    file = directory / f'{name}.ies'
+    file.write_bytes(tool.to_bytes()) # type: ignore
+    return file
+
+def write_block_stats(file: Path):
+    stats_path(file).write_text(json.dumps(compute_stats(file, BLOCK_ROWS)), encoding='utf-8')
+
+def full_scan(directory: Path, column: str, op: str, value: str) -> list[tuple[Path, dict]]:
+    matches = []
+    for file in sorted(directory.glob('*.ies')):
+        table = IesTable(file)
+        for index in range(len(table)):
+            row = table.row(index)
+            if column not in row:
+                continue
+            typed = value if isinstance(row[column], str) else float(value)
+            if OPERATORS[op](row[column], typed):
+                matches.append((file, row))
+    return matches
+
+@pytest.fixture
+def tables(tmp_path: Path) -> Path:
+    for name, tsv in (('Item', ITEM), ('Skill', SKILL)):
+        write_block_stats(write_table(tmp_path, name, tsv))
+    return tmp_path
+
+@pytest.mark.parametrize('op', list(OPERATORS))
+@pytest.mark.parametrize('column, value', [
+    ('Level', '150'),
+    ('Level', '1003'),
+    ('Level', '5000'),
+    ('Name', 'Name_15'),
+    ('Name', 'Skill_03'),
+    ('Grade', 'B'),
+    ('Grade', 'Z'),
+])
+def test_scan_matches_full_scan(tables, column, op, value):
+    scanner = TableScanner(tables)
+    assert list(scanner.scan([(column, op, value)])) == full_scan(tables, column, op, value)
+
+def test_tables_skipped(tables):
+    scanner = TableScanner(tables)
+    assert list(scanner.scan(['Level>=1000'])) == full_scan(tables, 'Level', '>=', '1000')
+    assert (scanner.tables, scanner.tables_skipped) == (2, 1)
+
+    # Grade lists all of its values, none of which is Z
+    scanner = TableScanner(tables)
+    assert list(scanner.scan(['Grade==Z'])) == []
+    assert (scanner.tables_skipped, scanner.rows_read) == (2, 0)
+
+def test_blocks_skipped(tables):
+    scanner = TableScanner(tables / 'Item.ies')
+    assert [row['ClassID'] for _, row in scanner.scan(['Level>=170', 'Level<=250'])] == list(range(17, 26))
+    # Rows 17 to 25 lie in the blocks of rows 17-24 and 25-32
+    assert (scanner.blocks, scanner.blocks_skipped, scanner.rows_read) == (5, 3, 16)
+
+def test_stats_ignored_after_rewrite(tables):
+    item = tables / 'Item.ies'
+    stats = stats_path(item).read_text(encoding='utf-8')
+    write_table(tables, 'Item', ITEM + [[41, 'Item_41', 'Name_41', 9000, 'C']])
+    stats_path(item).write_text(stats, encoding='utf-8')
+    assert load_stats(item) is None
+
+    scanner = TableScanner(item)
+    assert [row['ClassID'] for _, row in scanner.scan(['Level==9000'])] == [41]
+    assert scanner.rows_read == 41
+
+def test_stats_ignored_after_touch(tables):
+    item = tables / 'Item.ies'
+    stat = item.stat()
+    os.utime(item, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert load_stats(item) is None
+
+    scanner = TableScanner(item)
+    assert [row['ClassID'] for _, row in scanner.scan(['Level==5000'])] == []
+    assert (scanner.tables_skipped, scanner.rows_read) == (0, 40)
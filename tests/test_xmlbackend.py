@@ -0,0 +1,53 @@
+"""Both xml backends must write the same bytes and read the same tables.
+
+    $ python -m pytest tests
+"""
+import pytest
+from ies2xml import xml_bytes
+from ies_tools.schemacache import SchemaCache
+from ies_tools.xmlbackend import get_backend
+from xmltools import XMLTools
+
+TSV = [
+    ['ClassID', 'ClassName', 'Name', 'Level', 'Script', 'CP_Calc', 'Icon_NT', 'Desc'],
+    [1, 'Item_1', 'Plain', 10, 'SCR_A', 'SCR_GET_1', 'icon_1', ''],
+    [2, 'Item_2', 'Tab\there', 20, 'SCR_B', 'SCR_GET_2', 'icon_2', 'Line\nbreak'],
+    [3, 'Item_3', 'Carriage\rreturn', 30, 'SCR_C', 'SCR_GET_3', 'icon_3', 'Both\r\nends'],
+    [4, 'Item_4', 'Fish & <Chips>', 40, 'SCR_A', 'SCR_GET_4', 'icon_4', 'Say "hi" \'there\''],
+    [5, 'Item_5', '한글 이름', 50, 'SCR_B', 'SCR_GET_5', 'ícone', 'Ünïcödé ✓'],
+    [6, 'Item_6', 'Literal &#10; and &amp;', 60, 'SCR_C', 'SCR_GET_6', 'icon_6', '  padded  '],
+]
+
+@pytest.fixture(params=['stdlib', 'lxml'])
+def backend(request):
+    if request.param == 'lxml':
+        pytest.importorskip('lxml')
+    return request.param
+
+@pytest.fixture
+def document() -> bytes:
+    return xml_bytes(TSV, 'Item', get_backend('stdlib'))
+
+def encode(document: bytes, backend: str, schema_cache: SchemaCache | None = None) -> bytes:
+    tool = XMLTools(schema_cache, backend)
+    tool.load_xml(document, 'Item.xml')
+    return tool.to_bytes() # type: ignore
+
+def test_xml_bytes_match(backend, document):
+    assert xml_bytes(TSV, 'Item', get_backend(backend)) == document
+
+def test_ies_bytes_match(backend, document):
+    assert encode(document, backend) == encode(document, 'stdlib')
+
+def test_ies_bytes_match_with_schema_cache(backend, document, tmp_path):
+    expected = encode(document, 'stdlib')
+    schema_cache = SchemaCache(tmp_path)
+    # The first load records the schema, the second one uses it
+    assert encode(document, backend, schema_cache) == expected
+    assert encode(document, backend, schema_cache) == expected
+
+def test_unknown_column_rejected_with_schema_cache(backend, document, tmp_path):
+    schema_cache = SchemaCache(tmp_path)
+    encode(document, backend, schema_cache)
+    with pytest.raises(Exception, match='Unknown columns'):
+        encode(document.replace(b'ClassID="1"', b'ClassID="1" Extra="x"'), backend, schema_cache)
@@ -1,47 +1,10 @@
 import argparse
+import json
 import os
 from pathlib import Path
-from xmltools import XMLTools
-
-xml_tool = XMLTools()
-parser = argparse.ArgumentParser(
-    description = 'An .xml to .ies converter'
-)
-
-subparser = parser.add_subparsers(
-    help = 'subcommand help',
-    required = True,
-    dest = 'subcommand'
-)
-
-parser_file = subparser.add_parser(
-    'file',
-    help = 'file help'
-)
-
-parser_file.add_argument(
-    '--output', '-o',
-    required = False,
-    help = 'Optional output for a single file; overwrites default file',
-    type = Path
-)
-
-parser_file.add_argument(
-    'xml_file',
-    help = 'The xml file to convert',
-    type = Path
-)
-
-parser_batch = subparser.add_parser(
-    'batch',
-    help = 'batch help'
-)
-
-parser_batch.add_argument(
-    'directory',
-    help = 'The directory containing all .xml files to be batch converted',
-    type = Path
-)
+from ies_tools.binarywriter import encode_xor_lp_str, format_cache_info
+from ies_tools.discovery import find_files, mirror_path
+from ies_tools.schemacache import SchemaCache
 
 def verify_is_dir(dir: Path) -> bool:
     """Simple function to verify if a path is a directory or not
@@ -54,43 +17,251 @@ def verify_is_dir(dir: Path) -> bool:
     """
     return os.path.isdir(dir)
 
-def convert_to_ies(file: Path):
+def convert_to_ies(file: Path, workers: int = 1, schema_cache: SchemaCache | None = None, location: Path | None = None,
+                   shard: bool = False, stats: bool = False, dest: Path | None = None):
     """Converts a single xml file to ies format - Creates a folder named "ies_out" in the same directory as xml2ies.py
+       Each call uses its own XMLTools, so conversions can run concurrently from a thread pool
 
     Args:
         file (Path): the file to convert
-        dest (Path|None, optional): The destination path for the file to be placed. Defaults to None.
+        workers (int, optional): Number of worker processes used to encode rows of large tables. Defaults to 1.
+        schema_cache (SchemaCache | None, optional): Cache of known column schemas per id space. Defaults to None.
+        location (Path | None, optional): The directory the .ies file is written to. Defaults to "ies_out" in the current directory.
+        shard (bool, optional): Split tables with more rows than one .ies file can hold into shards with a manifest. 
+            Otherwise such tables are rejected while the xml is loaded. Defaults to False.
+        stats (bool, optional): Also write the column statistics of each .ies file written, see iesstats. Defaults to False.
+        dest (Path | None, optional): The .ies file to write instead of <name>.ies in location. The shards of a sharded table
+            and their manifest are named after it instead. Defaults to None.
     """
-    file_name = file.name[0: len(file.name) - 4]
+    file_name = file.name[0: len(file.name) - 4] if dest is None else dest.stem
+    if dest is not None:
+        location = dest.parent
     print(f'Converting {file.name} to {file_name}.ies')
-    xml_tool.load_xml(file)
-    location = os.path.realpath(os.path.join(os.getcwd(), "ies_out"))
-    if not os.path.isdir(location):
-        os.mkdir(location)
-    xml_tool.create_ies(location)
+    # Imported here so --help and other commands do not pay for the xml parser
+    from xmltools import XMLTools, MAX_ROWS
 
-def batch_convert_to_ies(directory: Path):
+    xml_tool = XMLTools(schema_cache)
+    xml_tool.load_xml(file, max_rows=None if shard else MAX_ROWS)
+    if location is None:
+        location = Path(os.path.realpath(os.path.join(os.getcwd(), "ies_out")))
+    # exist_ok so concurrent conversions do not race on creating the folder
+    os.makedirs(location, exist_ok=True)
+    if len(xml_tool.rows) > MAX_ROWS:
+        manifest = xml_tool.create_ies_shards(str(location), workers, name=file_name)
+        print(f'{file.name} has {len(xml_tool.rows)} rows - written as shards listed in {manifest}')
+        written = [location / shard['file'] for shard in json.loads(manifest.read_text(encoding='utf-8'))['shards']]
+    else:
+        xml_tool.create_ies(str(location), workers, file_name)
+        written = [location / f'{file_name}.ies']
+
+    if stats:
+        from iesstats import write_stats
+        for ies_file in written:
+            write_stats(ies_file)
+
+def batch_convert_to_ies(directory: Path, workers: int = 1, schema_cache: SchemaCache | None = None, 
+                         recursive: bool = False, output: Path | None = None, jobs: int = 1, shard: bool = False,
+                         stats: bool = False):
     """Converts all xml files within the given directory to .ies files
+       The largest files are converted first and the output directory mirrors the input directory tree
 
     Args:
         directory (Path): The directory containing the .xml files
+        workers (int, optional): Number of worker processes used to encode rows of large tables. Defaults to 1.
+        schema_cache (SchemaCache | None, optional): Cache of known column schemas per id space. Defaults to None.
+        recursive (bool, optional): Also convert the .xml files in sub directories. Defaults to False.
+        output (Path | None, optional): The output directory. Defaults to "ies_out" in the current directory.
+        jobs (int, optional): Number of files converted in parallel processes. Defaults to 1.
+        shard (bool, optional): Split tables with too many rows for one .ies file into shards. Defaults to False.
+        stats (bool, optional): Also write the column statistics of each .ies file written. Defaults to False.
     """
     if not verify_is_dir(directory):
         print(f'Directory not found {directory}. Please verify the correct directory was given')
         return
     
-    for xml_file in directory.glob('*.xml'):
-        try:
-            # Next update will include a specific batch folder
-            convert_to_ies(xml_file)
-        except Exception as e:
-            print(f"""Exception caught: {e}' Skipping {xml_file}""")
+    location = Path(os.path.realpath(os.path.join(os.getcwd(), "ies_out"))) if output is None else output
+    xml_files = find_files(directory, '*.xml', recursive)
+    # create_ies names the file itself, so only the mirrored directory is needed
+    destinations = [mirror_path(xml_file, directory, location, '.ies').parent for xml_file in xml_files]
+    
+    if jobs <= 1:
+        for xml_file, destination in zip(xml_files, destinations):
+            try:
+                convert_to_ies(xml_file, workers, schema_cache, destination, shard, stats)
+            except Exception as e:
+                print(f"""Exception caught: {e}' Skipping {xml_file}""")
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Submitted largest first, which is the order the pool starts them in
+        futures = {
+            executor.submit(convert_to_ies, xml_file, workers, schema_cache, destination, shard, stats): xml_file
+            for xml_file, destination in zip(xml_files, destinations)
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"""Exception caught: {e}' Skipping {futures[future]}""")
+
+def build_parser(prog: str | None = None) -> argparse.ArgumentParser:
+    """Builds the command line parser - nothing is built at import time so the module can be imported without side effects
+
+    Args:
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+
+    Returns:
+        argparse.ArgumentParser: The parser
+    """
+    parser = argparse.ArgumentParser(
+        prog = prog,
+        description = 'An .xml to .ies converter'
+    )
+
+    subparser = parser.add_subparsers(
+        help = 'subcommand help',
+        required = True,
+        dest = 'subcommand'
+    )
+
+    parser_file = subparser.add_parser(
+        'file',
+        help = 'file help'
+    )
+
+    parser_file.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'Optional .ies file to write; overrides the default ies_out/<name>.ies',
+        type = Path
+    )
+
+    parser_file.add_argument(
+        '--verbose', '-v',
+        action = 'store_true',
+        help = 'Print string cache statistics when done'
+    )
+
+    parser_file.add_argument(
+        '--schema-cache',
+        required = False,
+        help = 'Optional directory of recorded column schemas per id space; skips type inference when a schema exists',
+        type = Path
+    )
+
+    parser_file.add_argument(
+        '--shard',
+        action = 'store_true',
+        help = 'Split tables with more than 65535 rows into several .ies files and a .shards.json manifest'
+    )
 
+    parser_file.add_argument(
+        '--stats',
+        action = 'store_true',
+        help = 'Also write <name>.stats.json column statistics next to each .ies file, used by iesstats.py scan'
+    )
+
+    parser_file.add_argument(
+        '--workers', '-j',
+        required = False,
+        default = 1,
+        help = 'Number of worker processes used to encode rows of large tables',
+        type = int
+    )
+
+    parser_file.add_argument(
+        'xml_file',
+        help = 'The xml file to convert',
+        type = Path
+    )
+
+    parser_batch = subparser.add_parser(
+        'batch',
+        help = 'batch help'
+    )
+
+    parser_batch.add_argument(
+        '--verbose', '-v',
+        action = 'store_true',
+        help = 'Print string cache statistics when done'
+    )
+
+    parser_batch.add_argument(
+        '--schema-cache',
+        required = False,
+        help = 'Optional directory of recorded column schemas per id space; skips type inference when a schema exists',
+        type = Path
+    )
+
+    parser_batch.add_argument(
+        '--shard',
+        action = 'store_true',
+        help = 'Split tables with more than 65535 rows into several .ies files and a .shards.json manifest'
+    )
+
+    parser_batch.add_argument(
+        '--stats',
+        action = 'store_true',
+        help = 'Also write <name>.stats.json column statistics next to each .ies file, used by iesstats.py scan'
+    )
+
+    parser_batch.add_argument(
+        '--workers', '-j',
+        required = False,
+        default = 1,
+        help = 'Number of worker processes used to encode rows of large tables',
+        type = int
+    )
+
+    parser_batch.add_argument(
+        '--recursive', '-r',
+        action = 'store_true',
+        help = 'Also convert .xml files in sub directories'
+    )
+
+    parser_batch.add_argument(
+        '--output', '-o',
+        required = False,
+        help = 'Optional output directory; mirrors the input directory tree',
+        type = Path
+    )
+
+    parser_batch.add_argument(
+        '--jobs', '-p',
+        required = False,
+        default = 1,
+        help = 'Number of files converted in parallel processes',
+        type = int
+    )
+
+    parser_batch.add_argument(
+        'directory',
+        help = 'The directory containing all .xml files to be batch converted',
+        type = Path
+    )
     
-if __name__ == "__main__":
-    args = parser.parse_args()
+    return parser
+
+def main(argv: list[str] | None = None, prog: str | None = None):
+    """Runs the command line interface
+
+    Args:
+        argv (list[str] | None, optional): The arguments without the program name. Defaults to sys.argv[1:].
+        prog (str | None, optional): The program name shown in the usage. Defaults to the script name.
+    """
+    args = build_parser(prog).parse_args(argv)
     print(f'The subcommand chosen: {args.subcommand}')
+    schema_cache = SchemaCache(args.schema_cache) if args.schema_cache is not None else None
     if args.subcommand == 'file':
-        convert_to_ies(args.xml_file)
+        convert_to_ies(args.xml_file, args.workers, schema_cache, shard=args.shard, stats=args.stats, dest=args.output)
     else:
-        batch_convert_to_ies(args.directory)
\ No newline at end of file
+        batch_convert_to_ies(args.directory, args.workers, schema_cache, args.recursive, args.output, args.jobs, args.shard,
+                             args.stats)
+    if args.verbose:
+        # Rows encoded by worker processes are not counted here
+        print(format_cache_info('String cache', encode_xor_lp_str.cache_info()))
+
+if __name__ == "__main__":
+    main()
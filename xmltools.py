@@ -1,18 +1,60 @@
 import xml.etree.ElementTree as ET
+import json
 import struct
 import os
 import io
-from ies_tools.binarywriter import BinaryWriterTools
+from typing import BinaryIO, Iterable
+from ies_tools.binarywriter import BinaryWriterTools, encode_xor_lp_str
 from pathlib import Path
 from ies_tools.columntype import ColumnType as CT
 from ies_tools.iesheader import IesHeader
 from ies_tools.iesrow import IesRow
+from ies_tools.parallel import PARALLEL_MIN_ROWS, get_pool
 from ies_tools.iescolumn import IesColumn
 from ies_tools.propertyaccess import PropertyAccess as PA
+from ies_tools.schemacache import SchemaCache
+from ies_tools.xmlbackend import get_backend
+
+# Row and column counts are written as unsigned shorts
+MAX_ROWS = 0xFFFF
+MAX_COLUMNS = 0xFFFF
+# Rows handed over as a stream are encoded in blocks of this many rows
+STREAM_BLOCK_ROWS = 1024
+
+def encode_rows(rows: list[IesRow], sorted_columns: list[IesColumn]) -> bytes:
+    """ Encodes rows into the binary row format used by .ies files
+        Each call produces an independent block, so blocks of consecutive rows can be concatenated
+
+    Args:
+        rows (list[IesRow]): The rows to encode
+        sorted_columns (list[IesColumn]): The columns sorted by type (numbers first), then declaration index
+
+    Returns:
+        bytes: The encoded rows
+    """
+    number_names = [c.name for c in sorted_columns if c.isNumber()]
+    string_names = [c.name for c in sorted_columns if not c.isNumber()]
+    # The numbers of a row are stored next to each other, so they are packed in one call
+    pack_numbers = struct.Struct(f'<{len(number_names)}f').pack
+    encoded_rows = []
+    for row in rows:
+        numbers = [row[name] for name in number_names]
+        strings = [row[name] for name in string_names]
+        encoded_rows.append(b''.join([
+            struct.pack('<i', row.class_id),
+            encode_xor_lp_str(row.class_name),
+            pack_numbers(*[0 if value is None else value for value in numbers]), # type: ignore
+            # Strings come from the encoding cache, so repeated values cost a lookup; None is written as an empty string
+            *[encode_xor_lp_str("" if value is None else str(value)) for value in strings],
+            # The user scr flags are 1 only when the flag is True, also when it is missing from the dict
+            bytes([row.user_scr_dict.get(name) is True for name in string_names]),
+        ]))
+    return b''.join(encoded_rows)
 
 class XMLTools:
     """
         A tool for reading the ies xml data and converting that information back into .ies format
+        An instance holds the state of one conversion at a time - use one instance per thread
     """
     
     # Unused variables will be removed
@@ -34,15 +76,26 @@ class XMLTools:
          "CT_": PA.CT,
     }
     
-    def __init__(self):
+    def __init__(self, schema_cache: SchemaCache | None = None, xml_backend: str | None = None):
+        """
+        Args:
+            schema_cache (SchemaCache | None, optional): Cache of known column schemas per id space. 
+                When given, a recorded schema replaces type inference and a new one is recorded on first use. Defaults to None.
+            xml_backend (str | None, optional): The xml parser - auto, stdlib or lxml. All of them give the same rows and columns.
+                Defaults to the IES_XML_BACKEND environment variable, then auto (lxml when installed).
+        """
         self.__header_name_length: int = 0x40
         self.__column_size: int = 136
         self.__size_position: int = (2 * self.__header_name_length + 2 * struct.calcsize('<h')) # h = format code for short
+        # 3 sizes, 2 flag bytes, then row/column counts and padding - the column block starts right after
+        self.__header_size: int = self.__size_position + 3 * struct.calcsize('<I') + 2 * struct.calcsize('<B') + 5 * struct.calcsize('<H')
         self.header = IesHeader()
         self.columns: list[IesColumn] = []
         self.rows: list[IesRow] = []
         self.tree = None
         self.file_name = ""
+        self.schema_cache = schema_cache
+        self.xml_backend = get_backend(xml_backend)
     
     # Each of the following functions were made to
     # simulate the type conversion used in the original C# code
@@ -140,21 +193,56 @@ class XMLTools:
         return all(c == ' ' or c == '.' or ('0' <= c <= '9') for c in value)
         
     
-    def load_xml(self, file: Path):
+    def load_xml(self, source: Path | bytes | BinaryIO, file_name: str = "stream.xml", max_rows: int | None = MAX_ROWS):
         """ Loads the xml file information
 
         Args:
-            file (Path): The file path containing the xml file to load
+            source (Path | bytes | BinaryIO): The xml file path, the xml document itself or any readable stream containing it
+            file_name (str, optional): The name used for messages and for the .ies file name when source is not a path. Defaults to "stream.xml".
+            max_rows (int | None, optional): Stop parsing as soon as the table has more rows than this. Use None to allow any number of rows (e.g. to shard the table). Defaults to MAX_ROWS.
+
+        Raises:
+            Exception: If the table has more rows than max_rows or more columns than an .ies file can hold
         """
         
-        if not file.name.endswith(".xml"):
-            print(f'Incorrect file type passed to read_xml(self, file) {file.name} - Skipping this file')
-            return None
-        self.tree = ET.parse(file)
-        self.file_name = file.name
+        if isinstance(source, Path):
+            if not source.name.endswith(".xml"):
+                print(f'Incorrect file type passed to read_xml(self, file) {source.name} - Skipping this file')
+                return None
+            self.file_name = source.name
+        else:
+            self.file_name = file_name
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                source = io.BytesIO(bytes(source))
+        self.tree = self.__parse__(source, max_rows)
         self.__load_xml_columns__()
+        if len(self.columns) > MAX_COLUMNS:
+            raise Exception(f'{self.file_name} has {len(self.columns)} columns - an .ies file can hold at most {MAX_COLUMNS}')
         self.__load_xml_rows__()
     
+    def __parse__(self, source: Path | BinaryIO, max_rows: int | None) -> ET.ElementTree:
+        """ Parses the xml while counting the Class elements, so an oversized table is rejected
+            before the rest of the document has been read
+
+        Args:
+            source (Path | BinaryIO): The xml file path or a readable stream
+            max_rows (int | None): The maximum number of Class elements, None for no limit
+
+        Raises:
+            Exception: If there are more Class elements than max_rows
+
+        Returns:
+            ET.ElementTree: The parsed document
+        """
+        parser = self.xml_backend.iterparse(source)
+        row_count = 0
+        for _, element in parser:
+            if element.tag == self.__CLASS_ELEMENT:
+                row_count += 1
+                if max_rows is not None and row_count > max_rows:
+                    raise Exception(f'{self.file_name} has more than {max_rows} rows - an .ies file can hold at most {MAX_ROWS}. Use sharding to split it into several files')
+        return self.xml_backend.ElementTree(parser.root) # type: ignore
+    
     
     def __load_xml_rows__(self):
         """ Loads the IES row information from the xml file
@@ -192,8 +280,8 @@ class XMLTools:
                 else:
                     if column.isNumber():
                         if self.__is_value_numeric__(attribute) == False:
-                            print(f'There was an error in this file where expected value should be numeric. Key = {key} - Need to figure out how to display the lines')
-                            exit()
+                            # Raised instead of exiting so a bad file does not take down the whole process
+                            raise Exception(f'There was an error in {self.file_name} where expected value should be numeric. Key = {key} - Value = {attribute}')
                         row[key] = float(attribute)
                     else:
                         row[key] = attribute if attribute != None else ""
@@ -247,6 +335,12 @@ class XMLTools:
         else:
             class_elements.extend(root.findall(self.__CLASS_ELEMENT))
         
+        if self.schema_cache is not None:
+            cached_columns = self.schema_cache.load(self.header.id_space)
+            if cached_columns is not None:
+                self.__use_cached_columns__(cached_columns, class_elements)
+                return
+        
         # Iterate over all attributes of each element to verify column types
         column_types = {}
         for element in class_elements:
@@ -312,25 +406,159 @@ class XMLTools:
             self.header.column_count = len(self.columns)
             self.header.number_of_column_count = sum(column.isNumber() for column in self.columns)
             self.header.number_of_str_column_count = self.header.column_count - self.header.number_of_column_count
+        
+        if self.schema_cache is not None and len(self.columns) > 0:
+            self.schema_cache.save(self.header.id_space, self.columns)
     
+    def __use_cached_columns__(self, cached_columns: list[IesColumn], class_elements: list[ET.Element]):
+        """ Uses the columns recorded in the schema cache instead of inferring them from the attribute values
+            The xml is still checked for attributes the recorded schema does not know about
+
+        Args:
+            cached_columns (list[IesColumn]): The columns recorded for this id space
+            class_elements (list[ET.Element]): The Class elements of the xml
+
+        Raises:
+            Exception: If an attribute in the xml is not a column of the recorded schema
+        """
+        known_names = {column.name for column in cached_columns}
+        for element in class_elements:
+            # lxml gives the attribute names as a list, ElementTree as a keys view
+            unknown_names = set(element.attrib) - known_names
+            if unknown_names:
+                raise Exception(f'{self.file_name} does not match the cached schema for {self.header.id_space} - Unknown columns: {sorted(unknown_names)}')
         
+        self.columns.clear()
+        self.columns.extend(cached_columns)
+        self.header.row_count = len(class_elements)
+        self.header.use_class_id = any(column.name == self.__CLASS_ID for column in self.columns)
+        self.header.column_count = len(self.columns)
+        self.header.number_of_column_count = sum(column.isNumber() for column in self.columns)
+        self.header.number_of_str_column_count = self.header.column_count - self.header.number_of_column_count
         
-    def create_ies(self, directory: str):
+    def create_ies(self, directory: str, workers: int = 1, name: str | None = None):
         """Creates the ies file and saves it to the specified directory
 
         Args:
-            directory (str): _description_
+            directory (str): The directory the .ies file is written to
+            workers (int, optional): Number of processes used to encode the rows of large tables. Defaults to 1.
+            name (str | None, optional): The file name without .ies. Defaults to the name of the xml file.
+        """
+        
+        if name is None:
+            name = self.file_name[0: self.file_name.index('.xml')]
+        filename = name + ".ies"
+        full_path = os.path.join(directory, filename)
+        if self.header.id_space == None or len(self.header.id_space) == 0:
+            # id space should not be missing
+            print(f'Error writing to {filename} - Missing idspace. Verify the idspace exists or has been converted correctly before trying again')
+            return
+        
+        # Written next to the destination first, so a failed write does not leave half a file
+        partial = Path(full_path + '.partial')
+        try:
+            with partial.open('wb') as f:
+                self.write_ies(f, workers)
+            partial.replace(full_path)
+        finally:
+            partial.unlink(missing_ok=True)
+    
+    def to_bytes(self, workers: int = 1) -> bytes | None:
+        """Encodes the loaded xml as an .ies file in memory
+
+        Args:
+            workers (int, optional): Number of processes used to encode the rows of large tables. Defaults to 1.
+
+        Returns:
+            bytes | None: The .ies file, None if the idspace is missing
+        """
+        buffer = io.BytesIO()
+        if not self.write_ies(buffer, workers):
+            return None
+        return buffer.getvalue()
+    
+    def create_ies_shards(self, directory: str, workers: int = 1, max_rows: int = MAX_ROWS,
+                          name: str | None = None) -> Path | None:
+        """Splits a table that is too large for one .ies file into several files by ClassID range
+            The shards are named <name>.partNNN.ies and listed in order in the manifest <name>.shards.json
+            Shards are cut where the ClassID changes, so their ClassID ranges do not overlap unless a single ClassID
+            has more than max_rows rows; such a ClassID spans consecutive shards
+
+        Args:
+            directory (str): The directory the shards and the manifest are written to
+            workers (int, optional): Number of processes used to encode the rows of large tables. Defaults to 1.
+            max_rows (int, optional): The maximum number of rows per shard. Defaults to MAX_ROWS.
+            name (str | None, optional): The name the shards and the manifest start with. Defaults to the name of the xml file.
+
+        Returns:
+            Path | None: The path of the manifest, None if the idspace is missing
+        """
+        if name is None:
+            name = self.file_name[0: self.file_name.index('.xml')]
+        if self.header.id_space == None or len(self.header.id_space) == 0:
+            # id space should not be missing
+            print(f'Error writing to {name}.ies - Missing idspace. Verify the idspace exists or has been converted correctly before trying again')
+            return None
+        
+        # sorted is stable, so rows sharing a ClassID keep their order
+        rows = sorted(self.rows, key=lambda row: row.class_id)
+        shards = []
+        start = 0
+        shard_index = 0
+        while shard_index == 0 or start < len(rows):
+            end = min(start + max_rows, len(rows))
+            # Cut where the ClassID changes, so the ClassID ranges of the shards do not overlap.
+            # Only a ClassID with more rows than a shard holds has to span shards
+            cut = end
+            while end < len(rows) and cut > start and rows[cut - 1].class_id == rows[cut].class_id:
+                cut -= 1
+            if cut > start:
+                end = cut
+            shard_rows = rows[start:end]
+            start = end
+            shard_name = f'{name}.part{shard_index:03d}.ies'
+            with open(os.path.join(directory, shard_name), 'wb') as f:
+                self.write_ies(f, workers, shard_rows)
+            shards.append({
+                'file': shard_name,
+                'rows': len(shard_rows),
+                'min_class_id': shard_rows[0].class_id if shard_rows else None,
+                'max_class_id': shard_rows[-1].class_id if shard_rows else None,
+            })
+            shard_index += 1
+        
+        manifest = {
+            'idspace': self.header.id_space,
+            'rows': len(rows),
+            'shards': shards,
+        }
+        manifest_path = Path(directory, f'{name}.shards.json')
+        manifest_path.write_text(json.dumps(manifest, indent='\t'), encoding='utf-8')
+        return manifest_path
+    
+    def write_ies(self, writer: BinaryIO, workers: int = 1, rows: Iterable[IesRow] | None = None) -> bool:
+        """Writes the loaded xml as an .ies file to any binary writable (file, socket file, in-memory buffer)
+            The writer is only written to sequentially, it is never seeked
+
+        Args:
+            writer (BinaryIO): The destination of the .ies file
+            workers (int, optional): Number of processes used to encode the rows of large tables. Defaults to 1.
+            rows (Iterable[IesRow] | None, optional): The rows to write instead of all loaded rows. Rows that are not a list,
+                e.g. a generator, are encoded as they arrive and only their bytes are kept. Defaults to None.
+
+        Raises:
+            Exception: If there are more rows than an .ies file can hold
+
+        Returns:
+            bool: True if the file was written, False if the idspace is missing
         """
         
         # used for padding
         null_padding_short = self.__get_ushort__(0)
-        filename = self.file_name[0: self.file_name.index('.xml')] + ".ies"
-        full_path = os.path.join(directory, filename)
         idspace = self.header.id_space
         keyspace = self.header.key_space if self.header.key_space else ""
         columns = self.columns
-        rows = self.rows
-        row_count = len(rows)
+        rows = self.rows if rows is None else rows
         column_count = len(columns)
         number_of_column_count = sum(column.isNumber() for column in columns)
         string_column_count = column_count - number_of_column_count
@@ -341,72 +569,105 @@ class XMLTools:
         
         if idspace == None or len(idspace) == 0:
             # id space should not be missing
-            print(f'Error writing to {filename} - Missing idspace. Verify the idspace exists or has been converted correctly before trying again')
-            return
+            print(f'Error writing {self.file_name} - Missing idspace. Verify the idspace exists or has been converted correctly before trying again')
+            return False
         
-        with open(full_path, 'wb+') as raw_f:
-            # Pylance will say this is an error, but will run fine at runtime (i hope)
-            buffer = io.BufferedRandom(raw_f) # type: ignore
-            bwt = BinaryWriterTools(buffer)
-            bwt.write_fixed_string(idspace, self.__header_name_length)
-            bwt.write_fixed_string(keyspace, self.__header_name_length)
-            # According to what I was told the keyspace is deleted and not needed so skipping it
-            
-            buffer.write(self.__get_ushort__(self.header.Version))
-            buffer.write(null_padding_short)
-            buffer.write(self.__get_uint_32__(self.header.info_size))
-            buffer.write(self.__get_uint_32__(self.header.data_size))
-            buffer.write(self.__get_uint_32__(self.header.total_size))
-            buffer.write(self.__get_uint_8__(1)  if self.header.use_class_id == True else self.__get_uint_8__(0))
-            buffer.write(self.__get_uint_8__(0))
-            buffer.write(self.__get_ushort__(row_count))
-            buffer.write(self.__get_ushort__(column_count))
-            buffer.write(self.__get_ushort__(number_of_column_count))
-            buffer.write(self.__get_ushort__(string_column_count))
-            buffer.write(null_padding_short)
-            for c in columns:
-                bwt.write_xored_fixed_string(c.column, self.__header_name_length)
-                bwt.write_xored_fixed_string(c.name, self.__header_name_length)
-                buffer.write(self.__get_ushort__(c.column_type.value))
-                buffer.write(self.__get_ushort__(c.property_access.value))
-                buffer.write(self.__get_ushort__(c.sync))
-                buffer.write(self.__get_ushort__(c.declaration_index))
-            # end loop
-            rows_start = buffer.tell()
-            
-
-            for row in rows:
-                buffer.write(self.__get_int__(row.class_id))
-                bwt.write_xor_lp_str(row.class_name)
-                
-                for c in sorted_columns:
-
-                    value = row[c.name]
-                    if value is None:
-                        if c.isNumber():
-                            buffer.write(self.__get_float__(0))
-                        else:
-                            buffer.write(self.__get_ushort__(0))
-                    else:
-                        if c.isNumber():
-                            buffer.write(self.__get_float__(value)) # type: ignore
-                        else:
-                            bwt.write_xor_lp_str(str(value))
-                # end sorted loop
-                # Iterating over all the columns where the column is not a number
-                for c in [col for col in sorted_columns if col.isNumber() == False]:
-                    val = row.user_scr_dict.get(c.name)
-                    
-                    # This handles both when user scr is true or false and when user scr is none (not found in dict)
-                    buffer.write(self.__get_uint_8__(1) if val is True else self.__get_uint_8__(0)) 
-                # end loop
-            # end loop
-            self.header.info_size = column_count * self.__column_size
-            self.header.data_size = buffer.tell() - rows_start
-            self.header.total_size = buffer.tell()
-            buffer.seek(self.__size_position)
-            buffer.write(self.__get_uint_32__(self.header.info_size))
-            buffer.write(self.__get_uint_32__(self.header.data_size))
-            buffer.write(self.__get_uint_32__(self.header.total_size))
-            buffer.flush()
-            buffer.seek(0, io.SEEK_END)
+        chunks = None
+        if not isinstance(rows, list):
+            chunks, row_count = self.__encode_row_stream__(rows, sorted_columns)
+        else:
+            row_count = len(rows)
+        if row_count > MAX_ROWS:
+            raise Exception(f'Error writing {self.file_name} - {row_count} rows do not fit in one .ies file (at most {MAX_ROWS}). Use create_ies_shards instead')
+        if chunks is None:
+            chunks = self.__encode_row_chunks__(rows, sorted_columns, workers)
+        # The rows start right after the header and the column block
+        rows_start = self.__header_size + column_count * self.__column_size
+        self.header.info_size = column_count * self.__column_size
+        self.header.data_size = sum(len(chunk) for chunk in chunks)
+        self.header.total_size = rows_start + self.header.data_size
+        
+        # The header and column block are small, so they are put together in memory first
+        buffer = io.BytesIO()
+        bwt = BinaryWriterTools(buffer) # type: ignore
+        bwt.write_fixed_string(idspace, self.__header_name_length)
+        bwt.write_fixed_string(keyspace, self.__header_name_length)
+        # According to what I was told the keyspace is deleted and not needed so skipping it
+        
+        buffer.write(self.__get_ushort__(self.header.Version))
+        buffer.write(null_padding_short)
+        buffer.write(self.__get_uint_32__(self.header.info_size))
+        buffer.write(self.__get_uint_32__(self.header.data_size))
+        buffer.write(self.__get_uint_32__(self.header.total_size))
+        buffer.write(self.__get_uint_8__(1)  if self.header.use_class_id == True else self.__get_uint_8__(0))
+        buffer.write(self.__get_uint_8__(0))
+        buffer.write(self.__get_ushort__(row_count))
+        buffer.write(self.__get_ushort__(column_count))
+        buffer.write(self.__get_ushort__(number_of_column_count))
+        buffer.write(self.__get_ushort__(string_column_count))
+        buffer.write(null_padding_short)
+        for c in columns:
+            bwt.write_xored_fixed_string(c.column, self.__header_name_length)
+            bwt.write_xored_fixed_string(c.name, self.__header_name_length)
+            buffer.write(self.__get_ushort__(c.column_type.value))
+            buffer.write(self.__get_ushort__(c.property_access.value))
+            buffer.write(self.__get_ushort__(c.sync))
+            buffer.write(self.__get_ushort__(c.declaration_index))
+        # end loop
+        if buffer.tell() != rows_start:
+            raise Exception(f'Error writing {self.file_name} - Row offset {buffer.tell()} does not match {rows_start}')
+        
+        writer.write(buffer.getvalue())
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.flush()
+        return True
+    
+    def __encode_row_stream__(self, rows: Iterable[IesRow], sorted_columns: list[IesColumn]) -> tuple[list[bytes], int]:
+        """ Encodes rows as they are produced, so the rows themselves never have to be held all at once
+
+        Args:
+            rows (Iterable[IesRow]): The rows to encode
+            sorted_columns (list[IesColumn]): The columns sorted by type, then declaration index
+
+        Returns:
+            tuple[list[bytes], int]: The encoded chunks in row order and the number of rows
+        """
+        chunks: list[bytes] = []
+        block: list[IesRow] = []
+        row_count = 0
+        for row in rows:
+            block.append(row)
+            row_count += 1
+            if row_count > MAX_ROWS:
+                # No need to encode the rest, it can never be written
+                return chunks, row_count
+            if len(block) == STREAM_BLOCK_ROWS:
+                chunks.append(encode_rows(block, sorted_columns))
+                block = []
+        if block:
+            chunks.append(encode_rows(block, sorted_columns))
+        return chunks, row_count
+    
+    def __encode_row_chunks__(self, rows: list[IesRow], sorted_columns: list[IesColumn], workers: int) -> list[bytes]:
+        """ Encodes the rows as blocks of bytes that are written to file in order
+            Large tables are split into one chunk per worker and encoded in parallel
+
+        Args:
+            rows (list[IesRow]): The rows to encode
+            sorted_columns (list[IesColumn]): The columns sorted by type, then declaration index
+            workers (int): Number of processes used to encode the rows
+
+        Returns:
+            list[bytes]: The encoded chunks, in row order
+        """
+        if workers <= 1 or len(rows) < PARALLEL_MIN_ROWS:
+            return [encode_rows(rows, sorted_columns)]
+        
+        chunk_rows = -(-len(rows) // workers)
+        # The pool is shared by every table written in this process, map keeps the results in the same order as the chunks
+        return list(get_pool(workers).map(
+            encode_rows,
+            [rows[i:i + chunk_rows] for i in range(0, len(rows), chunk_rows)],
+            [sorted_columns] * workers
+        ))